@@ -0,0 +1,58 @@
+"""Compare the file listing backends of GitRepoUtils on a synthetic repository.
+
+Usage: poetry run python benchmarks/bench_file_listing.py [--num_files 100000] [--repeat 3]
+"""
+
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import fire
+
+from locify.utils.file import FILE_LISTING_BACKENDS, GitRepoUtils
+
+
+def create_synthetic_repo(repo_path: Path, num_files: int) -> None:
+    """Commit `num_files` files spread over nested directories, without a worktree."""
+
+    def git(*args: str, input: str | None = None) -> str:
+        return subprocess.run(
+            ['git', *args],
+            cwd=repo_path,
+            input=input,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+
+    git('init', '-q')
+    blob_sha = git('hash-object', '-w', '--stdin', input='pass\n')
+    index_info = ''.join(
+        f'100644 {blob_sha}\tpkg{i % 10}/mod{i // 10 % 100}/sub{i // 1000 % 10}/file{i}.py\n'
+        for i in range(num_files)
+    )
+    git('update-index', '--index-info', input=index_info)
+    tree_sha = git('write-tree')
+    commit_sha = git('commit-tree', tree_sha, '-m', 'Synthetic commit')
+    git('update-ref', 'HEAD', commit_sha)
+
+
+def main(num_files: int = 100_000, repeat: int = 3) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_path = Path(tmp_dir)
+        create_synthetic_repo(repo_path, num_files)
+
+        for backend in FILE_LISTING_BACKENDS:
+            timings = []
+            for _ in range(repeat):
+                git_utils = GitRepoUtils(str(repo_path), file_listing_backend=backend)
+                start = time.perf_counter()
+                tracked_files = git_utils.list_tracked_files()
+                timings.append(time.perf_counter() - start)
+            assert len(tracked_files) == num_files
+            print(f'{backend:>10}: {min(timings):.3f}s (best of {repeat})')
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
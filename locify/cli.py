@@ -2,20 +2,41 @@ import fire
 import fire.core
 
 from locify import FullMapStrategy, RepoMapStrategy
+from locify.server import DEFAULT_POLL_INTERVAL, MapClient, MapServer
 
 
 def main(strategy: str, **kwargs):
     valid_strategies = {'fullmap', 'repomap'}
+    valid_commands = {'serve', 'query'}
 
-    if strategy not in valid_strategies:
+    if strategy not in valid_strategies | valid_commands:
         raise fire.core.FireError(
-            f"Invalid strategy: {strategy}. Available strategies are: {', '.join(repr(s) for s in valid_strategies)}"
+            f"Invalid strategy: {strategy}. Available strategies are: {', '.join(repr(s) for s in valid_strategies)}, or use {' / '.join(repr(c) for c in valid_commands)} for the server"
         )
 
     if strategy == 'fullmap':
         return FullMapStrategy(**kwargs)
-    else:  # strategy == 'repomap'
+    elif strategy == 'repomap':
         return RepoMapStrategy(**kwargs)
+    elif strategy == 'serve':
+        return serve(**kwargs)
+    else:  # strategy == 'query'
+        return MapClient(**kwargs)
+
+
+def serve(
+    socket_path: str | None = None,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    **kwargs,
+) -> None:
+    """Serve a warm incremental `RepoMapStrategy` on a Unix socket until interrupted."""
+    server = MapServer(
+        RepoMapStrategy(incremental=True, **kwargs),
+        socket_path=socket_path,
+        poll_interval=poll_interval,
+    )
+    print(f'Serving on {server.socket_path}', flush=True)
+    server.serve_forever()
 
 
 if __name__ == '__main__':
@@ -1,57 +1,189 @@
+import asyncio
+import bisect
+import functools
+import hashlib
+import itertools
+import threading
 from collections import defaultdict
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
 
 from grep_ast import TreeContext
+from grep_ast.parsers import filename_to_lang
 
-from locify.tree_sitter.parser import ParsedTag, TagKind, TreeSitterParser
-from locify.utils.file import GitRepoUtils, read_text
+from locify.tree_sitter.cache import CACHE_DIR_NAME, TagCache
+from locify.tree_sitter.parallel import init_parser_worker, parse_files_in_parallel
+from locify.tree_sitter.parser import (
+    ParsedTag,
+    TagKind,
+    TreeSitterParser,
+    from_compact_tag,
+)
+from locify.utils.file import GitRepoUtils, get_file_stat, read_text
 from locify.utils.llm import get_token_count_from_text
+from locify.utils.lru import ByteBoundedLRUCache
 from locify.utils.path import PathUtils
 
+DEFAULT_RENDER_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_ASYNC_WORKERS = 4
+# Rough memory footprint of a TreeContext (per-line scopes, headers and nodes, plus the
+# tree-sitter tree) relative to the size of its source code
+TREE_CONTEXT_SIZE_FACTOR = 16
+
 
 class FullMapStrategy:
-    def __init__(self, model_name='gpt-4o', root='./') -> None:
+    def __init__(
+        self,
+        model_name='gpt-4o',
+        root='./',
+        use_cache=False,
+        workers=1,
+        render_cache_bytes=DEFAULT_RENDER_CACHE_BYTES,
+        file_listing_backend='traverse',
+        async_workers=DEFAULT_ASYNC_WORKERS,
+    ) -> None:
         if not Path(root).is_absolute():
             root = str(Path(root).resolve())
 
         self.root = root
         self.model_name = model_name
 
-        self.git_utils = GitRepoUtils(root)
+        self.git_utils = GitRepoUtils(root, file_listing_backend=file_listing_backend)
         self.path_utils = PathUtils(root)
-        self.ts_parser = TreeSitterParser()
+        self.tag_cache = (
+            TagCache(str(Path(root) / CACHE_DIR_NAME / 'tags.db'))
+            if use_cache
+            else None
+        )
+        self.ts_parser = TreeSitterParser(tag_cache=self.tag_cache)
+
+        self.workers = workers
+        self._process_pool: ProcessPoolExecutor | None = None
+
+        # Rendered trees keyed by (language, content hash, lines of interest), and parsed
+        # TreeContexts keyed by (language, content hash), sharing one byte budget
+        self.render_cache = ByteBoundedLRUCache(render_cache_bytes)
+
+        # The async API runs blocking work on a bounded thread pool. Ranking and rendering
+        # mutate shared state and are serialized by the lock, while files are parsed
+        # concurrently, each thread with its own parser. Parses in flight are shared by
+        # concurrent requests, keyed by file and content version.
+        self.async_workers = async_workers
+        self._thread_pool: ThreadPoolExecutor | None = None
+        self._thread_local = threading.local()
+        self._lock = threading.RLock()
+        self._inflight_parses: dict[tuple, asyncio.Future] = {}
+        self._inflight_waiters: dict[tuple, int] = defaultdict(int)
+
+    def close(self) -> None:
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+            self._thread_pool = None
+        if self.tag_cache is not None:
+            self.tag_cache.close()
 
-    def get_map(self, depth: int | None = None, rel_dir_path: str | None = None) -> str:
+    def get_map(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
+    ) -> str:
+        return '\n'.join(
+            self.iter_map(depth=depth, rel_dir_path=rel_dir_path, max_tokens=max_tokens)
+        )
+
+    def iter_map(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
+    ) -> Iterator[str]:
+        """Yield the rendered chunk of each file of the map, in order.
+
+        Joining the chunks with newlines gives `get_map`. Without `max_tokens`, each chunk
+        is rendered only when requested.
+        """
         ranked_tags = self.get_ranked_tags(rel_dir_path=rel_dir_path, depth=depth)
-        tree_repr = self.tag_list_to_tree(ranked_tags)
-        return tree_repr
+        if max_tokens is not None:
+            yield from self.tag_list_to_chunks_within_budget(ranked_tags, max_tokens)
+        else:
+            yield from self.iter_tree_chunks(ranked_tags)
+
+    def stream_map(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
+    ) -> None:
+        """Write the map to stdout one file chunk at a time, as they are rendered."""
+        for chunk in self.iter_map(
+            depth=depth, rel_dir_path=rel_dir_path, max_tokens=max_tokens
+        ):
+            print(chunk, flush=True)
 
     def get_map_with_token_count(
-        self, depth: int | None = None, rel_dir_path: str | None = None
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
     ) -> str:
-        tree_repr = self.get_map(depth=depth, rel_dir_path=rel_dir_path)
+        tree_repr = self.get_map(
+            depth=depth, rel_dir_path=rel_dir_path, max_tokens=max_tokens
+        )
         token_count = get_token_count_from_text(self.model_name, tree_repr)
         return f'{tree_repr}\n\nToken count: {token_count}'
 
-    def get_ranked_tags(
+    async def aget_map(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
+    ) -> str:
+        """Async `get_map`, which keeps the event loop free while the map is built."""
+        ranked_tags = await self.aget_ranked_tags(
+            depth=depth, rel_dir_path=rel_dir_path
+        )
+        return await self._arender_map(ranked_tags, max_tokens)
+
+    async def aget_ranked_tags(
         self, depth: int | None = None, rel_dir_path: str | None = None
     ) -> list[ParsedTag]:
-        if rel_dir_path:
-            all_abs_files = self.git_utils.get_absolute_tracked_files_in_directory(
-                rel_dir_path=rel_dir_path,
-                depth=depth,
-            )
-        else:
-            all_abs_files = self.git_utils.get_all_absolute_tracked_files(depth=depth)
+        """Async `get_ranked_tags`.
+
+        Files are parsed on the thread pool, sharing the parses in flight with concurrent
+        requests. Cancelling the request cancels the parses no other request waits for.
+        """
+        file_tags = await self._aparse_files(depth, rel_dir_path)
+        return await self._run_locked(
+            self.get_ranked_tags,
+            depth=depth,
+            rel_dir_path=rel_dir_path,
+            file_tags=file_tags,
+        )
+
+    def get_ranked_tags(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        *,
+        file_tags: dict[str, list[ParsedTag]] | None = None,
+    ) -> list[ParsedTag]:
+        """Tags of the definitions in the files in scope, by file and line.
+
+        `file_tags` can hold the already parsed tags of some files, by absolute path.
+        """
+        all_abs_files = self.get_all_abs_files(depth=depth, rel_dir_path=rel_dir_path)
 
         identwrel2tags = defaultdict(
             set
         )  # (relative file, symbol identifier) -> set of its tags
 
-        for abs_file in all_abs_files:
-            rel_file = self.path_utils.get_relative_path_str(abs_file)
-            parsed_tags = self.ts_parser.get_tags_from_file(abs_file, rel_file)
-
+        for rel_file, parsed_tags in self.iter_file_tags(all_abs_files, file_tags):
             for parsed_tag in parsed_tags:
                 if parsed_tag.tag_kind == TagKind.DEF:
                     identwrel2tags[(rel_file, parsed_tag.node_name)].add(parsed_tag)
@@ -63,55 +195,364 @@ class FullMapStrategy:
         all_tags.sort(key=lambda tag: (tag.rel_path, tag.start_line))
         return all_tags
 
-    def tag_list_to_tree(self, tags: list[ParsedTag]) -> str:
-        if not tags:
-            return ''
+    def get_all_abs_files(
+        self, depth: int | None = None, rel_dir_path: str | None = None
+    ) -> list[str]:
+        if rel_dir_path:
+            return self.git_utils.get_absolute_tracked_files_in_directory(
+                rel_dir_path=rel_dir_path,
+                depth=depth,
+            )
+        return self.git_utils.get_all_absolute_tracked_files(depth=depth)
 
-        cur_rel_file, cur_abs_file = '', ''
-        lois: list[int] = []
-        output = ''
+    def iter_file_tags(
+        self,
+        abs_files: list[str],
+        file_tags: dict[str, list[ParsedTag]] | None = None,
+    ) -> Iterator[tuple[str, list[ParsedTag]]]:
+        """Yield (relative file, parsed tags) for each file, in the given order.
 
-        dummy_tag = ParsedTag(
-            abs_path='', rel_path='', node_name='', tag_kind=TagKind.DEF, start_line=0
+        Files in `file_tags` are not parsed again.
+        """
+        if file_tags is None:
+            file_tags = {}
+        files_to_parse = [
+            abs_file for abs_file in abs_files if abs_file not in file_tags
+        ]
+        blob_shas = (
+            self.git_utils.get_all_tracked_blob_shas()
+            if self.tag_cache and files_to_parse
+            else {}
         )
-        for tag in tags + [dummy_tag]:  # Add dummy tag to trigger last file output
-            if tag.rel_path != cur_rel_file:
-                if lois:
-                    output += cur_rel_file + ':\n'
-                    output += self.render_tree(cur_abs_file, cur_rel_file, lois)
-                    lois = []
-                elif cur_rel_file:  # No line of interest
-                    output += '\n' + cur_rel_file + ':\n'
+        file_entries = [
+            (
+                abs_file,
+                self.path_utils.get_relative_path_str(abs_file),
+                blob_shas.get(abs_file),
+            )
+            for abs_file in files_to_parse
+        ]
 
-                cur_abs_file = tag.abs_path
-                cur_rel_file = tag.rel_path
+        if self.workers > 1 and len(file_entries) > 1:
+            parse_results = self._iter_file_tags_in_parallel(file_entries)
+        else:
+            parse_results = (
+                (
+                    rel_file,
+                    self.ts_parser.get_tags_from_file(
+                        abs_file, rel_file, blob_sha=blob_sha
+                    ),
+                )
+                for abs_file, rel_file, blob_sha in file_entries
+            )
+
+        for abs_file in abs_files:
+            if abs_file in file_tags:
+                yield (
+                    self.path_utils.get_relative_path_str(abs_file),
+                    file_tags[abs_file],
+                )
+            else:
+                yield next(parse_results)
+
+        if self.tag_cache:
+            self.tag_cache.flush()
+
+    def _iter_file_tags_in_parallel(
+        self, file_entries: list[tuple[str, str, str | None]]
+    ) -> Iterator[tuple[str, list[ParsedTag]]]:
+        # Cache lookups stay in this process, only the misses are shipped to the workers
+        all_cached_tags = [
+            self.ts_parser.get_cached_tags(abs_file, rel_file, blob_sha)
+            for abs_file, rel_file, blob_sha in file_entries
+        ]
+        files_to_parse = [
+            (abs_file, rel_file)
+            for (abs_file, rel_file, _), cached_tags in zip(
+                file_entries, all_cached_tags
+            )
+            if cached_tags is None
+        ]
+        parse_results = parse_files_in_parallel(
+            self._get_process_pool(), files_to_parse, self.workers
+        )
 
-            lois.append(tag.start_line)
+        for (abs_file, rel_file, blob_sha), cached_tags in zip(
+            file_entries, all_cached_tags
+        ):
+            if cached_tags is not None:
+                yield rel_file, cached_tags
+                continue
 
+            compact_tags = next(parse_results)
+            if compact_tags is None:
+                yield rel_file, []
+                continue
+
+            parsed_tags = [
+                from_compact_tag(compact_tag, rel_file, abs_file)
+                for compact_tag in compact_tags
+            ]
+            self.ts_parser.put_cached_tags(abs_file, blob_sha, parsed_tags)
+            yield rel_file, parsed_tags
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=init_parser_worker
+            )
+        return self._process_pool
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.async_workers)
+        return self._thread_pool
+
+    async def _run_in_thread(self, func: Callable, *args, **kwargs) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_thread_pool(), functools.partial(func, *args, **kwargs)
+        )
+
+    async def _run_locked(self, func: Callable, *args, **kwargs) -> Any:
+        def run_locked():
+            with self._lock:
+                return func(*args, **kwargs)
+
+        return await self._run_in_thread(run_locked)
+
+    def _needs_all_file_tags(self, depth: int | None, rel_dir_path: str | None) -> bool:
+        """Whether `get_ranked_tags` will need the tags of every file in scope."""
+        return True
+
+    async def _aparse_files(
+        self, depth: int | None, rel_dir_path: str | None
+    ) -> dict[str, list[ParsedTag]]:
+        if not self._needs_all_file_tags(depth, rel_dir_path):
+            return {}
+
+        # GitPython's Repo is not thread-safe, so listing files runs under the lock too
+        file_entries = await self._run_locked(
+            self._get_file_entries_to_parse, depth, rel_dir_path
+        )
+        keys = [
+            (abs_file, blob_sha, file_stat)
+            for abs_file, _, blob_sha, file_stat in file_entries
+        ]
+        futures = []
+        for key, (abs_file, rel_file, blob_sha, _) in zip(keys, file_entries):
+            future = self._inflight_parses.get(key)
+            # A future cancelled by another request may not be forgotten yet
+            if future is None or future.done():
+                future = asyncio.get_running_loop().run_in_executor(
+                    self._get_thread_pool(),
+                    self._parse_file_in_thread,
+                    abs_file,
+                    rel_file,
+                    blob_sha,
+                )
+                self._inflight_parses[key] = future
+                future.add_done_callback(
+                    functools.partial(self._forget_inflight_parse, key)
+                )
+            self._inflight_waiters[key] += 1
+            futures.append(future)
+
+        try:
+            # Shielded, so that cancelling this request leaves the parses to the others
+            all_parsed_tags = await asyncio.gather(
+                *(asyncio.shield(future) for future in futures)
+            )
+        finally:
+            for key, future in zip(keys, futures):
+                self._inflight_waiters[key] -= 1
+                if not self._inflight_waiters[key]:
+                    del self._inflight_waiters[key]
+                    future.cancel()
+        return {
+            abs_file: parsed_tags
+            for (abs_file, _, _, _), parsed_tags in zip(file_entries, all_parsed_tags)
+        }
+
+    def _get_file_entries_to_parse(
+        self, depth: int | None, rel_dir_path: str | None
+    ) -> list[tuple[str, str, str | None, tuple[int, int]]]:
+        """(absolute file, relative file, blob SHA, file stat) of each file in scope."""
+        abs_files = self.get_all_abs_files(depth=depth, rel_dir_path=rel_dir_path)
+        blob_shas = self.git_utils.get_all_tracked_blob_shas() if self.tag_cache else {}
+        return [
+            (
+                abs_file,
+                self.path_utils.get_relative_path_str(abs_file),
+                blob_shas.get(abs_file),
+                get_file_stat(abs_file),
+            )
+            for abs_file in abs_files
+        ]
+
+    def _parse_file_in_thread(
+        self, abs_file: str, rel_file: str, blob_sha: str | None
+    ) -> list[ParsedTag]:
+        ts_parser = getattr(self._thread_local, 'ts_parser', None)
+        if ts_parser is None:
+            ts_parser = TreeSitterParser(tag_cache=self.tag_cache)
+            self._thread_local.ts_parser = ts_parser
+        return ts_parser.get_tags_from_file(abs_file, rel_file, blob_sha=blob_sha)
+
+    def _forget_inflight_parse(self, key: tuple, future: asyncio.Future) -> None:
+        if self._inflight_parses.get(key) is future:
+            del self._inflight_parses[key]
+
+    async def _arender_map(
+        self, ranked_tags: list[ParsedTag], max_tokens: int | None
+    ) -> str:
+        if max_tokens is not None:
+            return await self._run_locked(
+                self.tag_list_to_tree_within_budget, ranked_tags, max_tokens
+            )
+
+        # One file at a time, so that a cancelled request stops between files
+        chunks = []
+        for abs_file, rel_file, lois in group_tags_by_file(ranked_tags):
+            chunks.append(
+                await self._run_locked(self.render_file_chunk, abs_file, rel_file, lois)
+            )
+        return '\n'.join(chunks)
+
+    def tag_list_to_tree(self, tags: list[ParsedTag]) -> str:
+        return '\n'.join(self.iter_tree_chunks(tags))
+
+    def iter_tree_chunks(self, tags: list[ParsedTag]) -> Iterator[str]:
+        for abs_file, rel_file, lois in group_tags_by_file(tags):
+            yield self.render_file_chunk(abs_file, rel_file, lois)
+
+    def tag_list_to_tree_within_budget(
+        self, tags: list[ParsedTag], max_tokens: int
+    ) -> str:
+        return '\n'.join(self.tag_list_to_chunks_within_budget(tags, max_tokens))
+
+    def tag_list_to_chunks_within_budget(
+        self, tags: list[ParsedTag], max_tokens: int
+    ) -> list[str]:
+        """Render the file chunks of the longest prefix of `tags` that fits in `max_tokens`.
+
+        Prefix lengths are binary searched. Each probe only renders and tokenizes the file
+        chunks it has not seen yet, and estimates the map's token count as the sum of its
+        chunks' counts; only the final candidates are tokenized as a whole. Like the search,
+        this assumes that longer prefixes never produce fewer tokens, which holds closely but
+        not exactly, so a longer fitting prefix may occasionally be missed.
+        """
+        file_groups = group_tags_by_file(tags)
+        group_ends = list(itertools.accumulate(len(lois) for _, _, lois in file_groups))
+        chunk_cache: dict[tuple[str, tuple[int, ...]], str] = {}
+        chunk_token_counts: dict[str, int] = {}
+
+        def render_prefix(num_tags: int) -> list[str]:
+            num_groups = bisect.bisect_left(group_ends, num_tags)
+            chunks = []
+            for i, (abs_file, rel_file, lois) in enumerate(
+                file_groups[: num_groups + 1]
+            ):
+                if i == num_groups:
+                    # The last group is cut by the prefix, if it is not empty
+                    lois = lois[: num_tags - (group_ends[i - 1] if i else 0)]
+                    if not lois:
+                        break
+                key = (rel_file, tuple(lois))
+                if key not in chunk_cache:
+                    chunk_cache[key] = self.render_file_chunk(abs_file, rel_file, lois)
+                chunks.append(chunk_cache[key])
+            return chunks
+
+        def estimate_token_count(chunks: list[str]) -> int:
+            for chunk in chunks:
+                if chunk not in chunk_token_counts:
+                    chunk_token_counts[chunk] = get_token_count_from_text(
+                        self.model_name, chunk
+                    )
+            return sum(chunk_token_counts[chunk] for chunk in chunks)
+
+        def fits(num_tags: int, exact: bool) -> bool:
+            chunks = render_prefix(num_tags)
+            if exact:
+                token_count = get_token_count_from_text(
+                    self.model_name, '\n'.join(chunks)
+                )
+            else:
+                token_count = estimate_token_count(chunks)
+            return token_count <= max_tokens
+
+        def find_longest_prefix(low: int, high: int, exact: bool) -> int:
+            # Largest num_tags in [low, high] that fits, assuming `low` does
+            while low < high:
+                mid = (low + high + 1) // 2
+                if fits(mid, exact):
+                    low = mid
+                else:
+                    high = mid - 1
+            return low
+
+        num_tags = find_longest_prefix(0, len(tags), exact=False)
+        # The estimate ignores the newlines joining the chunks, and tokens may merge across
+        # chunk boundaries, so it can fall a little short: fix it up with exact counts
+        if num_tags and not fits(num_tags, exact=True):
+            num_tags = find_longest_prefix(0, num_tags - 1, exact=True)
+        return render_prefix(num_tags)
+
+    def render_file_chunk(self, abs_file: str, rel_file: str, lois: list[int]) -> str:
+        output = rel_file + ':\n' + self.render_tree(abs_file, rel_file, lois)
         # Truncate long lines in case we get minified js or something else crazy
-        output = '\n'.join(line[:150] for line in output.splitlines())
-        return output
+        return '\n'.join(line[:150] for line in output.splitlines())
 
     def render_tree(self, abs_file: str, rel_file: str, lois: list) -> str:
         code = read_text(abs_file) or ''
         if not code.endswith('\n'):
             code += '\n'
 
-        context = TreeContext(
-            filename=rel_file,
-            code=code,
-            color=False,
-            line_number=True,
-            child_context=False,
-            last_line=False,
-            margin=0,
-            mark_lois=False,
-            loi_pad=0,
-            # header_max=30,
-            show_top_of_file_parent_scope=False,
+        content_key = (
+            filename_to_lang(rel_file),
+            hashlib.sha1(code.encode('utf-8')).digest(),
         )
+        render_key = (content_key, frozenset(lois))
+        res = self.render_cache.get(render_key)
+        if res is not None:
+            return res
+
+        context = self.render_cache.get(content_key)
+        if context is None:
+            context = TreeContext(
+                filename=rel_file,
+                code=code,
+                color=False,
+                line_number=True,
+                child_context=False,
+                last_line=False,
+                margin=0,
+                mark_lois=False,
+                loi_pad=0,
+                # header_max=30,
+                show_top_of_file_parent_scope=False,
+            )
+            self.render_cache.put(
+                content_key, context, len(code) * TREE_CONTEXT_SIZE_FACTOR
+            )
+        else:
+            # Parsing and scope analysis only depend on the code, so a cached context is
+            # reused once the state left by the previous lines of interest is reset
+            context.lines_of_interest = set()
+            context.show_lines = set()
 
         context.add_lines_of_interest(lois)
         context.add_context()
         res = context.format()
+        self.render_cache.put(render_key, res, len(res))
         return res
+
+
+def group_tags_by_file(tags: list[ParsedTag]) -> list[tuple[str, str, list[int]]]:
+    """Group consecutive tags of the same file into (abs file, rel file, lines of interest)."""
+    file_groups: list[tuple[str, str, list[int]]] = []
+    for tag in tags:
+        if not file_groups or file_groups[-1][1] != tag.rel_path:
+            file_groups.append((tag.abs_path, tag.rel_path, []))
+        file_groups[-1][2].append(tag.start_line)
+    return file_groups
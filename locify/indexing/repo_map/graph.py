@@ -0,0 +1,77 @@
+import itertools
+
+import numpy as np
+
+
+class ReferenceGraph:
+    """File-level reference graph, with files and identifiers interned to integer ids.
+
+    Edges are grouped by the identifier that creates them, so that the edges of an
+    identifier can be replaced when the files defining or referencing it change.
+    """
+
+    def __init__(self) -> None:
+        self.rel_files: list[str] = []
+        self.rel_file_ids: dict[str, int] = {}
+        self.idents: list[str] = []
+        self.ident_ids: dict[str, int] = {}
+
+        # ident id -> [(referencing file id, defining file id, weight)]
+        self._ident2edges: dict[int, list[tuple[int, int, int]]] = {}
+        self._edge_arrays: tuple[np.ndarray, ...] | None = None
+        # Bumped on every edge change, so that derived matrices can be cached
+        self.version = 0
+
+    def intern_rel_file(self, rel_file: str) -> int:
+        rel_file_id = self.rel_file_ids.get(rel_file)
+        if rel_file_id is None:
+            rel_file_id = len(self.rel_files)
+            self.rel_file_ids[rel_file] = rel_file_id
+            self.rel_files.append(rel_file)
+        return rel_file_id
+
+    def intern_ident(self, ident: str) -> int:
+        ident_id = self.ident_ids.get(ident)
+        if ident_id is None:
+            ident_id = len(self.idents)
+            self.ident_ids[ident] = ident_id
+            self.idents.append(ident)
+        return ident_id
+
+    def set_ident_edges(self, ident: str, edges: list[tuple[str, str, int]]) -> None:
+        """Replace the (referencing file, defining file, weight) edges of an identifier."""
+        ident_id = self.intern_ident(ident)
+        id_edges = [
+            (
+                self.intern_rel_file(src_rel_file),
+                self.intern_rel_file(dst_rel_file),
+                weight,
+            )
+            for src_rel_file, dst_rel_file, weight in edges
+        ]
+        if id_edges == self._ident2edges.get(ident_id, []):
+            return
+
+        if id_edges:
+            self._ident2edges[ident_id] = id_edges
+        else:
+            del self._ident2edges[ident_id]
+        self._edge_arrays = None
+        self.version += 1
+
+    def get_edge_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return parallel (src file id, dst file id, ident id, weight) arrays of all edges."""
+        if self._edge_arrays is None:
+            num_edges = sum(len(edges) for edges in self._ident2edges.values())
+            edges = np.fromiter(
+                itertools.chain.from_iterable(self._ident2edges.values()),
+                dtype=np.dtype((np.int64, 3)),
+                count=num_edges,
+            )
+            ident_ids = np.repeat(
+                np.fromiter(self._ident2edges.keys(), dtype=np.int64),
+                [len(edges) for edges in self._ident2edges.values()],
+            )
+            self._edge_arrays = (edges[:, 0], edges[:, 1], ident_ids, edges[:, 2])
+        src_ids, dst_ids, ident_ids, weights = self._edge_arrays
+        return src_ids, dst_ids, ident_ids, weights
@@ -1,86 +1,449 @@
-import math
-from collections import Counter, defaultdict
+from collections import defaultdict, namedtuple
+from collections.abc import Iterator
 
 import networkx as nx
+import numpy as np
 
-from locify.indexing.full_map.strategy import FullMapStrategy
+from locify.indexing.full_map.strategy import (
+    DEFAULT_ASYNC_WORKERS,
+    DEFAULT_RENDER_CACHE_BYTES,
+    FullMapStrategy,
+)
+from locify.indexing.repo_map.graph import ReferenceGraph
+from locify.indexing.repo_map.pagerank import (
+    DEFAULT_TOL,
+    build_transition_matrix,
+    pagerank,
+)
+from locify.indexing.repo_map.tag_index import TagIndex
 from locify.tree_sitter.parser import ParsedTag, TagKind
+from locify.utils.file import get_file_stat
+from locify.utils.llm import get_token_count_from_text
+
+# 'networkx' is the original implementation, kept as a reference for the sparse one
+PAGERANK_BACKENDS = ('sparse', 'networkx')
+MAX_CACHED_RANK_MATRICES = 8
+# Warm starts stop at a much tighter tolerance, so that their result does not depend on
+# the previous ranking, up to differences far below the tolerance of a cold start
+WARM_START_TOL = DEFAULT_TOL * 1e-3
+
+# Nodes and row-normalized weights of the reference graph, for one set of boosted identifiers
+RankMatrix = namedtuple(
+    'RankMatrix',
+    (
+        'node_file_ids',
+        'src_node_ids',
+        'weights',
+        'transition_t',
+        'out_weights',
+        'pair_keys',  # dst file id * number of identifiers + ident id
+        'pair_ids',  # index into pair_keys of each edge
+    ),
+)
 
 
 class RepoMapStrategy(FullMapStrategy):
-    def __init__(self, model_name='gpt-4o', root='./') -> None:
-        super().__init__(model_name, root)
+    def __init__(
+        self,
+        model_name='gpt-4o',
+        root='./',
+        use_cache=False,
+        workers=1,
+        incremental=False,
+        pagerank_backend='sparse',
+        render_cache_bytes=DEFAULT_RENDER_CACHE_BYTES,
+        file_listing_backend='traverse',
+        async_workers=DEFAULT_ASYNC_WORKERS,
+    ) -> None:
+        super().__init__(
+            model_name,
+            root,
+            use_cache=use_cache,
+            workers=workers,
+            render_cache_bytes=render_cache_bytes,
+            file_listing_backend=file_listing_backend,
+            async_workers=async_workers,
+        )
 
-    def get_ranked_tags(
+        if pagerank_backend not in PAGERANK_BACKENDS:
+            raise ValueError(
+                f"Invalid pagerank backend: {pagerank_backend}. Available backends are: {', '.join(repr(b) for b in PAGERANK_BACKENDS)}"
+            )
+        self.pagerank_backend = pagerank_backend
+
+        # In incremental mode, the tag index and graph below are kept between calls and
+        # only patched for the files that changed since the previous call
+        self.incremental = incremental
+        self.tag_index = TagIndex()
+        self.graph = ReferenceGraph()
+        self._snapshot_scope: tuple[int | None, str | None] | None = None
+        self._snapshot_head_sha = ''
+        self._snapshot_modified_files: set[str] = set()
+        self._snapshot_file_stats: dict[str, tuple[int, int]] = {}
+
+        # Transition matrices of the current graph, and the last scores to warm-start from,
+        # reused when only the mentioned files and identifiers change between calls
+        self._rank_matrices: dict[frozenset[int], RankMatrix] = {}
+        self._rank_matrices_version: int | None = None
+        self._last_ranks = np.zeros(0)
+        self._last_ranks_graph: ReferenceGraph | None = None
+        self._last_ranks_graph_version: int | None = None
+        self._last_ranks_query: tuple[frozenset, frozenset] | None = None
+        self.last_pagerank_iterations = 0
+
+    def get_map(
         self,
         depth: int | None = None,
         rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
         mentioned_rel_files: set | None = None,
         mentioned_idents: set | None = None,
-    ) -> list[ParsedTag]:
-        if rel_dir_path:
-            all_abs_files = self.git_utils.get_absolute_tracked_files_in_directory(
-                rel_dir_path=rel_dir_path,
+    ) -> str:
+        return '\n'.join(
+            self.iter_map(
                 depth=depth,
+                rel_dir_path=rel_dir_path,
+                max_tokens=max_tokens,
+                mentioned_rel_files=mentioned_rel_files,
+                mentioned_idents=mentioned_idents,
             )
+        )
+
+    def iter_map(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
+        mentioned_rel_files: set | None = None,
+        mentioned_idents: set | None = None,
+    ) -> Iterator[str]:
+        """Yield the rendered chunk of each file of the map, from the most relevant file."""
+        ranked_tags = self.get_ranked_tags(
+            depth=depth,
+            rel_dir_path=rel_dir_path,
+            mentioned_rel_files=mentioned_rel_files,
+            mentioned_idents=mentioned_idents,
+        )
+        if max_tokens is not None:
+            yield from self.tag_list_to_chunks_within_budget(ranked_tags, max_tokens)
         else:
-            all_abs_files = self.git_utils.get_all_absolute_tracked_files(depth=depth)
+            yield from self.iter_tree_chunks(ranked_tags)
+
+    def stream_map(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
+        mentioned_rel_files: set | None = None,
+        mentioned_idents: set | None = None,
+    ) -> None:
+        for chunk in self.iter_map(
+            depth=depth,
+            rel_dir_path=rel_dir_path,
+            max_tokens=max_tokens,
+            mentioned_rel_files=mentioned_rel_files,
+            mentioned_idents=mentioned_idents,
+        ):
+            print(chunk, flush=True)
+
+    def get_map_with_token_count(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
+        mentioned_rel_files: set | None = None,
+        mentioned_idents: set | None = None,
+    ) -> str:
+        tree_repr = self.get_map(
+            depth=depth,
+            rel_dir_path=rel_dir_path,
+            max_tokens=max_tokens,
+            mentioned_rel_files=mentioned_rel_files,
+            mentioned_idents=mentioned_idents,
+        )
+        token_count = get_token_count_from_text(self.model_name, tree_repr)
+        return f'{tree_repr}\n\nToken count: {token_count}'
+
+    async def aget_map(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        max_tokens: int | None = None,
+        mentioned_rel_files: set | None = None,
+        mentioned_idents: set | None = None,
+    ) -> str:
+        ranked_tags = await self.aget_ranked_tags(
+            depth=depth,
+            rel_dir_path=rel_dir_path,
+            mentioned_rel_files=mentioned_rel_files,
+            mentioned_idents=mentioned_idents,
+        )
+        return await self._arender_map(ranked_tags, max_tokens)
+
+    async def aget_ranked_tags(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        mentioned_rel_files: set | None = None,
+        mentioned_idents: set | None = None,
+    ) -> list[ParsedTag]:
+        """Async `get_ranked_tags`, see `FullMapStrategy.aget_ranked_tags`."""
+        file_tags = await self._aparse_files(depth, rel_dir_path)
+        return await self._run_locked(
+            self.get_ranked_tags,
+            depth=depth,
+            rel_dir_path=rel_dir_path,
+            mentioned_rel_files=mentioned_rel_files,
+            mentioned_idents=mentioned_idents,
+            file_tags=file_tags,
+        )
+
+    def get_ranked_tags(
+        self,
+        depth: int | None = None,
+        rel_dir_path: str | None = None,
+        mentioned_rel_files: set | None = None,
+        mentioned_idents: set | None = None,
+        *,
+        file_tags: dict[str, list[ParsedTag]] | None = None,
+    ) -> list[ParsedTag]:
+        all_abs_files = self.get_all_abs_files(depth=depth, rel_dir_path=rel_dir_path)
         num_files = len(all_abs_files)
         if mentioned_rel_files is None:
             mentioned_rel_files = set()
         if mentioned_idents is None:
             mentioned_idents = set()
 
-        ident2defrels = defaultdict(
-            set
-        )  # symbol identifier -> set of its definitions' relative file paths
-        ident2refrels = defaultdict(
-            list
-        )  # symbol identifier -> list of its references' relative file paths
-        identwrel2tags = defaultdict(
-            set
-        )  # (relative file, symbol identifier) -> set of its tags
-        personalization_dict = {}
-        personalization_val = 100 / num_files
+        if self.incremental and self._snapshot_scope == (depth, rel_dir_path):
+            self._refresh_index(all_abs_files, file_tags)
+        else:
+            self._rebuild_index(all_abs_files, file_tags)
+            self._snapshot_scope = (depth, rel_dir_path) if self.incremental else None
 
+        personalization_dict = {}
+        personalization_val = 100 / num_files if num_files else 0
         for abs_file in all_abs_files:
             rel_file = self.path_utils.get_relative_path_str(abs_file)
-
             if rel_file in mentioned_rel_files:
                 personalization_dict[rel_file] = personalization_val
 
-            parsed_tags = self.ts_parser.get_tags_from_file(abs_file, rel_file)
+        if self.pagerank_backend == 'networkx':
+            pagerank_scores, identwrel2score = self._rank_with_networkx(
+                personalization_dict, mentioned_idents
+            )
+        else:
+            pagerank_scores, identwrel2score = self._rank_with_sparse_matrix(
+                personalization_dict, mentioned_idents
+            )
+        # Ties are broken by file path and identifier to keep the output deterministic
+        sorted_identwrel2score = sorted(
+            identwrel2score.items(), key=lambda x: (-x[1], x[0])
+        )
 
-            for parsed_tag in parsed_tags:
-                if parsed_tag.tag_kind == TagKind.DEF:
-                    ident2defrels[parsed_tag.node_name].add(rel_file)
-                    identwrel2tags[(rel_file, parsed_tag.node_name)].add(parsed_tag)
-                if parsed_tag.tag_kind == TagKind.REF:
-                    ident2refrels[parsed_tag.node_name].append(rel_file)
+        ranked_tags: list[ParsedTag] = []
+        for (rel_file, ident), score in sorted_identwrel2score:
+            # print(f"{score:.03f} {rel_file} {ident}")
+            ranked_tags.extend(
+                sorted(
+                    self.tag_index.identwrel2tags.get((rel_file, ident), []),
+                    key=lambda tag: tag.start_line,
+                )
+            )
 
-        all_idents = set(ident2defrels.keys()).intersection(set(ident2refrels.keys()))
+        rel_files_has_tags = set(tag.rel_path for tag in ranked_tags)
 
-        G = nx.MultiDiGraph()
-        for ident in all_idents:
-            defining_rel_files = ident2defrels[ident]
-            if ident in mentioned_idents:
-                multiplier = 10
-            else:
-                multiplier = 1
-
-            for referencing_rel_file, num_refs in Counter(ident2refrels[ident]).items():
-                for defining_rel_file in defining_rel_files:
-                    num_refs = int(
-                        math.sqrt(num_refs)
-                    )  # Scale down the number of references
-                    G.add_edge(
-                        referencing_rel_file,
-                        defining_rel_file,
-                        weight=num_refs * multiplier,
-                        identifier=ident,
+        for src_rel_file, _ in sorted(
+            pagerank_scores.items(), key=lambda x: (-x[1], x[0])
+        ):
+            if src_rel_file not in rel_files_has_tags:
+                ranked_tags.append(
+                    ParsedTag(  # Add a dummy tag for files with no tags
+                        tag_kind=TagKind.DEF,
+                        node_name='NO_NAME',
+                        rel_path=src_rel_file,
+                        abs_path=self.path_utils.get_absolute_path_str(src_rel_file),
+                        start_line=-1,
                     )
+                )
+
+        # Note: Sort the tags by file path and line number can destroy the pagerank order
+        # ranked_tags.sort(key=lambda tag: (tag.rel_path, tag.start_line))
+        return ranked_tags
+
+    def _rank_with_sparse_matrix(
+        self, personalization_dict: dict[str, float], mentioned_idents: set
+    ) -> tuple[dict[str, float], dict[tuple[str, str], float]]:
+        graph = self.graph
+        rank_matrix = self._get_rank_matrix(mentioned_idents)
+        node_file_ids = rank_matrix.node_file_ids
+        src_node_ids = rank_matrix.src_node_ids
+        weights = rank_matrix.weights
+        out_weights = rank_matrix.out_weights
+        num_nodes = len(node_file_ids)
+
+        personalization = None
+        if personalization_dict:
+            personalization = np.zeros(num_nodes)
+            for rel_file, value in personalization_dict.items():
+                rel_file_id = graph.rel_file_ids.get(rel_file, -1)
+                node_id = np.searchsorted(node_file_ids, rel_file_id)
+                if node_id < num_nodes and node_file_ids[node_id] == rel_file_id:
+                    personalization[node_id] = value
+            if not personalization.any():
+                personalization = None
+
+        # Scores are only reused or warm-started from for the same personalization and
+        # boosted identifiers, since starting from the scores of another query converges
+        # to a slightly different, order-dependent result
+        rank_query = (
+            frozenset(personalization_dict.items()),
+            frozenset(mentioned_idents),
+        )
+        if rank_query != self._last_ranks_query:
+            ranks, self.last_pagerank_iterations = pagerank(
+                rank_matrix.transition_t,
+                out_weights,
+                personalization=personalization,
+                dangling=personalization,
+            )
+        elif (
+            self._last_ranks_graph is graph
+            and self._last_ranks_graph_version == graph.version
+        ):
+            ranks = self._last_ranks[node_file_ids]
+            self.last_pagerank_iterations = 0
+        else:
+            ranks, self.last_pagerank_iterations = pagerank(
+                rank_matrix.transition_t,
+                out_weights,
+                personalization=personalization,
+                dangling=personalization,
+                tol=WARM_START_TOL,
+                nstart=self._get_warm_start(node_file_ids),
+            )
+        self._last_ranks = np.zeros(len(graph.rel_files))
+        self._last_ranks[node_file_ids] = ranks
+        self._last_ranks_graph = graph
+        self._last_ranks_graph_version = graph.version
+        self._last_ranks_query = rank_query
+
+        # Distribute each file's rank over its out-edges, summed per (dst file, identifier)
+        edge_scores = ranks[src_node_ids] * weights / out_weights[src_node_ids]
+        pair_keys = rank_matrix.pair_keys
+        pair_scores = np.bincount(
+            rank_matrix.pair_ids, weights=edge_scores, minlength=len(pair_keys)
+        )
+        num_idents = len(graph.idents)
+
+        pagerank_scores = {
+            graph.rel_files[rel_file_id]: rank
+            for rel_file_id, rank in zip(node_file_ids.tolist(), ranks.tolist())
+        }
+        identwrel2score = {
+            (
+                graph.rel_files[pair_key // num_idents],
+                graph.idents[pair_key % num_idents],
+            ): score
+            for pair_key, score in zip(pair_keys.tolist(), pair_scores.tolist())
+        }
+        return pagerank_scores, identwrel2score
+
+    def _get_rank_matrix(self, mentioned_idents: set) -> RankMatrix:
+        """Get the transition matrix for a set of boosted identifiers, cached per graph version."""
+        graph = self.graph
+        if self._rank_matrices_version != graph.version:
+            self._rank_matrices = {}
+            self._rank_matrices_version = graph.version
+
+        boosted_ident_ids = frozenset(
+            graph.ident_ids[ident]
+            for ident in mentioned_idents
+            if ident in graph.ident_ids
+        )
+        rank_matrix = self._rank_matrices.get(boosted_ident_ids)
+        if rank_matrix is not None:
+            return rank_matrix
+
+        src_ids, dst_ids, ident_ids, weights = graph.get_edge_arrays()
+        if boosted_ident_ids:
+            weights = weights * np.where(
+                np.isin(ident_ids, list(boosted_ident_ids)), 10, 1
+            )
+        weights = weights.astype(np.float64)
+
+        # Nodes are the files with at least one edge, numbered in file id order
+        num_edges = len(src_ids)
+        node_file_ids, node_ids = np.unique(
+            np.concatenate((src_ids, dst_ids)), return_inverse=True
+        )
+        src_node_ids, dst_node_ids = node_ids[:num_edges], node_ids[num_edges:]
+        transition_t, out_weights = build_transition_matrix(
+            len(node_file_ids), src_node_ids, dst_node_ids, weights
+        )
+        pair_keys, pair_ids = np.unique(
+            dst_ids * len(graph.idents) + ident_ids, return_inverse=True
+        )
+        rank_matrix = RankMatrix(
+            node_file_ids=node_file_ids,
+            pair_keys=pair_keys,
+            pair_ids=pair_ids,
+            src_node_ids=src_node_ids,
+            weights=weights,
+            transition_t=transition_t,
+            out_weights=out_weights,
+        )
+
+        if len(self._rank_matrices) >= MAX_CACHED_RANK_MATRICES:
+            del self._rank_matrices[next(iter(self._rank_matrices))]
+        self._rank_matrices[boosted_ident_ids] = rank_matrix
+        return rank_matrix
+
+    def _get_warm_start(self, node_file_ids: np.ndarray) -> np.ndarray | None:
+        """Map the scores of the previous ranking onto the current nodes."""
+        if self._last_ranks_graph is None:
+            return None
+
+        last_ranks = self._last_ranks
+        if self._last_ranks_graph is not self.graph:
+            # File ids are only stable within a graph, translate them through the paths
+            last_graph = self._last_ranks_graph
+            last_ranks = np.zeros(len(self.graph.rel_files))
+            for rel_file_id, rel_file in enumerate(self.graph.rel_files):
+                last_rel_file_id = last_graph.rel_file_ids.get(rel_file)
+                if last_rel_file_id is not None and last_rel_file_id < len(
+                    self._last_ranks
+                ):
+                    last_ranks[rel_file_id] = self._last_ranks[last_rel_file_id]
+
+        nstart = np.zeros(len(node_file_ids))
+        known = node_file_ids < len(last_ranks)
+        nstart[known] = last_ranks[node_file_ids[known]]
+        return nstart if nstart.any() else None
+
+    def _rank_with_networkx(
+        self, personalization_dict: dict[str, float], mentioned_idents: set
+    ) -> tuple[dict[str, float], dict[tuple[str, str], float]]:
+        """Reference implementation of `_rank_with_sparse_matrix`."""
+        graph = self.graph
+        G = nx.MultiDiGraph()
+        for src_id, dst_id, ident_id, weight in zip(
+            *(array.tolist() for array in graph.get_edge_arrays())
+        ):
+            ident = graph.idents[ident_id]
+            multiplier = 10 if ident in mentioned_idents else 1
+            G.add_edge(
+                graph.rel_files[src_id],
+                graph.rel_files[dst_id],
+                weight=weight * multiplier,
+                identifier=ident,
+            )
 
         pers_kwargs = {}
+        personalization_dict = {
+            rel_file: value
+            for rel_file, value in personalization_dict.items()
+            if rel_file in G
+        }
         if personalization_dict:
             pers_kwargs = {
                 'personalization': personalization_dict,
@@ -100,35 +463,85 @@ class RepoMapStrategy(FullMapStrategy):
                 weight = data['weight']
                 score = src_file_rank * weight / total_weight
                 identwrel2score[(dst_rel_file, ident)] += score
-        sorted_identwrel2score = sorted(
-            identwrel2score.items(), key=lambda x: x[1], reverse=True
-        )
+        return pagerank_scores, identwrel2score
 
-        ranked_tags: list[ParsedTag] = []
-        for (rel_file, ident), score in sorted_identwrel2score:
-            # print(f"{score:.03f} {rel_file} {ident}")
-            ranked_tags.extend(identwrel2tags.get((rel_file, ident), []))
+    def _needs_all_file_tags(self, depth: int | None, rel_dir_path: str | None) -> bool:
+        # An incremental refresh only parses the few files that changed
+        return not (self.incremental and self._snapshot_scope == (depth, rel_dir_path))
+
+    def _rebuild_index(
+        self,
+        all_abs_files: list[str],
+        file_tags: dict[str, list[ParsedTag]] | None = None,
+    ) -> None:
+        self.tag_index = TagIndex()
+        self.graph = ReferenceGraph()
+        self._rank_matrices_version = None
+
+        affected_idents: set[str] = set()
+        for rel_file, parsed_tags in self.iter_file_tags(all_abs_files, file_tags):
+            affected_idents |= self.tag_index.set_file_tags(rel_file, parsed_tags)
+        self._patch_graph(affected_idents)
+
+        if self.incremental:
+            self._snapshot_head_sha = self.git_utils.get_head_commit_sha()
+            self._snapshot_modified_files = (
+                self.git_utils.get_all_absolute_modified_files()
+            )
+            self._snapshot_file_stats = {
+                abs_file: get_file_stat(abs_file) for abs_file in all_abs_files
+            }
+
+    def _refresh_index(
+        self,
+        all_abs_files: list[str],
+        file_tags: dict[str, list[ParsedTag]] | None = None,
+    ) -> None:
+        head_sha = self.git_utils.get_head_commit_sha()
+        modified_files = self.git_utils.get_all_absolute_modified_files()
+
+        # Only files touched by a commit, or dirty now or at the previous snapshot, can
+        # differ from what is indexed
+        candidate_files = modified_files | self._snapshot_modified_files
+        if head_sha != self._snapshot_head_sha:
+            candidate_files |= self.git_utils.get_absolute_files_changed_between(
+                self._snapshot_head_sha, head_sha
+            )
 
-        rel_files_with_no_tags = set(
-            self.path_utils.get_relative_path_str(abs_file)
+        current_files = set(all_abs_files)
+        removed_files = self._snapshot_file_stats.keys() - current_files
+        added_files = current_files - self._snapshot_file_stats.keys()
+        changed_files = set()
+        for abs_file in candidate_files & current_files:
+            if abs_file in added_files:
+                continue
+            file_stat = get_file_stat(abs_file)
+            if file_stat != self._snapshot_file_stats[abs_file]:
+                changed_files.add(abs_file)
+
+        affected_idents: set[str] = set()
+        for abs_file in removed_files:
+            rel_file = self.path_utils.get_relative_path_str(abs_file)
+            affected_idents |= self.tag_index.remove_file(rel_file)
+            del self._snapshot_file_stats[abs_file]
+
+        # Keep the order of the tracked files so the result matches a full rebuild
+        files_to_parse = [
+            abs_file
             for abs_file in all_abs_files
-        )
-        rel_files_has_tags = set(tag.rel_path for tag in ranked_tags)
+            if abs_file in added_files or abs_file in changed_files
+        ]
+        for abs_file, (rel_file, parsed_tags) in zip(
+            files_to_parse, self.iter_file_tags(files_to_parse, file_tags)
+        ):
+            affected_idents |= self.tag_index.set_file_tags(rel_file, parsed_tags)
+            self._snapshot_file_stats[abs_file] = get_file_stat(abs_file)
+        self._patch_graph(affected_idents)
 
-        for src_rel_file, _ in pagerank_scores.items():
-            if src_rel_file in rel_files_has_tags:
-                rel_files_with_no_tags.remove(src_rel_file)
-            if src_rel_file not in rel_files_has_tags:
-                ranked_tags.append(
-                    ParsedTag(  # Add a dummy tag for files with no tags
-                        tag_kind=TagKind.DEF,
-                        node_name='NO_NAME',
-                        rel_path=src_rel_file,
-                        abs_path=self.path_utils.get_absolute_path_str(src_rel_file),
-                        start_line=-1,
-                    )
-                )
+        self._snapshot_head_sha = head_sha
+        self._snapshot_modified_files = modified_files
 
-        # Note: Sort the tags by file path and line number can destroy the pagerank order
-        # ranked_tags.sort(key=lambda tag: (tag.rel_path, tag.start_line))
-        return ranked_tags
+    def _patch_graph(self, affected_idents: set[str]) -> None:
+        """Replace the edges of the given identifiers with their current ones."""
+        for ident in affected_idents:
+            self.graph.set_ident_edges(ident, self.tag_index.get_edges(ident))
@@ -0,0 +1,77 @@
+import math
+from collections import Counter, defaultdict
+
+from locify.tree_sitter.parser import ParsedTag, TagKind
+
+
+class TagIndex:
+    """Tags of each file and the definition/reference maps derived from them.
+
+    Files can be replaced or removed one at a time; each update reports the identifiers whose
+    edges in the reference graph may have changed.
+    """
+
+    def __init__(self) -> None:
+        self.file_tags: dict[str, list[ParsedTag]] = {}
+        self.ident2defrels: defaultdict[str, set[str]] = defaultdict(
+            set
+        )  # symbol identifier -> set of its definitions' relative file paths
+        self.ident2refrels: defaultdict[str, Counter[str]] = defaultdict(
+            Counter
+        )  # symbol identifier -> number of references per relative file path
+        self.identwrel2tags: defaultdict[tuple[str, str], set[ParsedTag]] = defaultdict(
+            set
+        )  # (relative file, symbol identifier) -> set of its tags
+
+    def set_file_tags(self, rel_file: str, parsed_tags: list[ParsedTag]) -> set[str]:
+        affected_idents = self.remove_file(rel_file)
+        self.file_tags[rel_file] = parsed_tags
+
+        for parsed_tag in parsed_tags:
+            if parsed_tag.tag_kind == TagKind.DEF:
+                self.ident2defrels[parsed_tag.node_name].add(rel_file)
+                self.identwrel2tags[(rel_file, parsed_tag.node_name)].add(parsed_tag)
+            if parsed_tag.tag_kind == TagKind.REF:
+                self.ident2refrels[parsed_tag.node_name][rel_file] += 1
+            affected_idents.add(parsed_tag.node_name)
+        return affected_idents
+
+    def remove_file(self, rel_file: str) -> set[str]:
+        parsed_tags = self.file_tags.pop(rel_file, [])
+
+        affected_idents = set()
+        for parsed_tag in parsed_tags:
+            ident = parsed_tag.node_name
+            affected_idents.add(ident)
+            if parsed_tag.tag_kind == TagKind.DEF:
+                self.identwrel2tags.pop((rel_file, ident), None)
+                defining_rel_files = self.ident2defrels.get(ident)
+                if defining_rel_files is not None:
+                    defining_rel_files.discard(rel_file)
+                    if not defining_rel_files:
+                        del self.ident2defrels[ident]
+            if parsed_tag.tag_kind == TagKind.REF:
+                ref_counts = self.ident2refrels.get(ident)
+                if ref_counts is not None:
+                    ref_counts.pop(rel_file, None)
+                    if not ref_counts:
+                        del self.ident2refrels[ident]
+        return affected_idents
+
+    def get_all_idents(self) -> set[str]:
+        """Identifiers that are both defined and referenced, i.e. that produce edges."""
+        return set(self.ident2defrels.keys()).intersection(self.ident2refrels.keys())
+
+    def get_edges(self, ident: str) -> list[tuple[str, str, int]]:
+        """Edges (referencing file, defining file, weight) contributed by an identifier."""
+        defining_rel_files = self.ident2defrels.get(ident)
+        ref_counts = self.ident2refrels.get(ident)
+        if not defining_rel_files or not ref_counts:
+            return []
+
+        edges = []
+        for referencing_rel_file, num_refs in ref_counts.items():
+            weight = int(math.sqrt(num_refs))  # Scale down the number of references
+            for defining_rel_file in defining_rel_files:
+                edges.append((referencing_rel_file, defining_rel_file, weight))
+        return edges
@@ -0,0 +1,206 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import Any
+
+from locify.indexing.repo_map.strategy import RepoMapStrategy
+from locify.tree_sitter.cache import CACHE_DIR_NAME
+from locify.tree_sitter.parser import ParsedTag
+from locify.utils.file import get_file_stat
+
+SOCKET_FILE_NAME = 'server.sock'
+DEFAULT_POLL_INTERVAL = 1.0
+SERVER_METHODS = ('get_map', 'get_map_with_token_count', 'get_ranked_tags')
+# Parameters sent as JSON lists that the strategies expect as sets
+SET_PARAMS = ('mentioned_rel_files', 'mentioned_idents')
+
+
+def get_default_socket_path(root: str) -> str:
+    return str(Path(root).resolve() / CACHE_DIR_NAME / SOCKET_FILE_NAME)
+
+
+class MapServer:
+    """Keep an incremental `RepoMapStrategy` warm and answer queries on a Unix socket.
+
+    Requests and responses are single-line JSON objects: `{"method": ..., "params": {...}}`
+    is answered with `{"result": ...}` or `{"error": ...}`. A watcher thread polls the
+    worktree and refreshes the index of the last queried scope as soon as files change, so
+    that queries only pay for ranking and rendering.
+    """
+
+    def __init__(
+        self,
+        strategy: RepoMapStrategy,
+        socket_path: str | None = None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ) -> None:
+        if not strategy.incremental:
+            raise ValueError('The server needs a strategy in incremental mode')
+        self.strategy = strategy
+        self.socket_path = socket_path or get_default_socket_path(strategy.root)
+        self.poll_interval = poll_interval
+
+        # The strategy is not thread-safe, queries and refreshes take turns
+        self._lock = threading.Lock()
+        self._scope: dict[str, Any] = {'depth': None, 'rel_dir_path': None}
+        self._worktree_state: tuple | None = None
+        self._stop_event = threading.Event()
+        self._watcher: threading.Thread | None = None
+        self._server: socketserver.UnixStreamServer | None = None
+
+    def start(self) -> None:
+        """Index the repository, then start listening and watching in the background."""
+        with self._lock:
+            self._worktree_state = self.get_worktree_state()
+            self.strategy.get_ranked_tags(**self._scope)
+
+        Path(self.socket_path).parent.mkdir(parents=True, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = socketserver.UnixStreamServer(
+            self.socket_path, self._make_request_handler()
+        )
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            self._stop_event.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.strategy.close()
+
+    def handle_request(self, request: dict) -> dict:
+        method = request.get('method')
+        if method not in SERVER_METHODS:
+            return {'error': f'Unknown method: {method}'}
+        params = dict(request.get('params') or {})
+        for param in SET_PARAMS:
+            if params.get(param) is not None:
+                params[param] = set(params[param])
+
+        try:
+            with self._lock:
+                result = getattr(self.strategy, method)(**params)
+                self._scope = {
+                    'depth': params.get('depth'),
+                    'rel_dir_path': params.get('rel_dir_path'),
+                }
+        except Exception as e:
+            return {'error': f'{type(e).__name__}: {e}'}
+
+        if method == 'get_ranked_tags':
+            result = [tag_to_json(tag) for tag in result]
+        return {'result': result}
+
+    def get_worktree_state(self) -> tuple:
+        """Cheap fingerprint of the worktree, which changes whenever a tracked file does."""
+        git_utils = self.strategy.git_utils
+        modified_files = git_utils.get_all_absolute_modified_files()
+        try:
+            index_mtime_ns = os.stat(Path(git_utils.repo.git_dir) / 'index').st_mtime_ns
+        except OSError:
+            index_mtime_ns = -1
+        return (
+            git_utils.get_head_commit_sha(),
+            index_mtime_ns,
+            frozenset(
+                (abs_file, get_file_stat(abs_file)) for abs_file in modified_files
+            ),
+        )
+
+    def refresh_if_changed(self) -> bool:
+        """Refresh the index of the last queried scope if the worktree changed."""
+        with self._lock:
+            worktree_state = self.get_worktree_state()
+            if worktree_state == self._worktree_state:
+                return False
+            self.strategy.get_ranked_tags(**self._scope)
+            self._worktree_state = worktree_state
+            return True
+
+    def _watch(self) -> None:
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.refresh_if_changed()
+            except Exception:
+                # E.g. a file removed mid-refresh, the next poll will pick it up
+                continue
+
+    def _make_request_handler(self) -> type[socketserver.StreamRequestHandler]:
+        server = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        response = {'error': f'Invalid request: {e}'}
+                    else:
+                        response = server.handle_request(request)
+                    self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+        return RequestHandler
+
+
+class MapClient:
+    """Client of a `MapServer`, with the query methods of the strategies."""
+
+    def __init__(self, root: str = './', socket_path: str | None = None) -> None:
+        self.socket_path = socket_path or get_default_socket_path(root)
+
+    def call(self, method: str, **params) -> Any:
+        for param in SET_PARAMS:
+            if params.get(param) is not None:
+                params[param] = sorted(params[param])
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            with sock.makefile('rwb') as stream:
+                request = {'method': method, 'params': params}
+                stream.write(json.dumps(request).encode('utf-8') + b'\n')
+                stream.flush()
+                response = json.loads(stream.readline())
+
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def get_map(self, **params) -> str:
+        return self.call('get_map', **params)
+
+    def get_map_with_token_count(self, **params) -> str:
+        return self.call('get_map_with_token_count', **params)
+
+    def get_ranked_tags(self, **params) -> list[dict]:
+        return self.call('get_ranked_tags', **params)
+
+
+def tag_to_json(tag: ParsedTag) -> dict:
+    return {
+        'rel_path': tag.rel_path,
+        'start_line': tag.start_line,
+        'node_name': tag.node_name,
+        'tag_kind': tag.tag_kind.value,
+    }
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+CACHE_DIR_NAME = '.locify'
+CACHE_FORMAT_VERSION = 1
+QUERIES_DIR = Path(__file__).resolve().parent / 'queries'
+
+# (start_line, node_name, tag_kind value), without the paths repeated on every tag
+CompactTag = tuple[int, str, str]
+
+
+def get_cache_version() -> str:
+    """Fingerprint everything that can change the tags extracted from a blob."""
+    hasher = hashlib.sha256()
+    hasher.update(f'format={CACHE_FORMAT_VERSION}\n'.encode())
+    for dist_name in ('tree-sitter', 'tree-sitter-languages', 'grep-ast'):
+        try:
+            dist_version = version(dist_name)
+        except PackageNotFoundError:
+            dist_version = 'unknown'
+        hasher.update(f'{dist_name}=={dist_version}\n'.encode())
+    for query_file in sorted(QUERIES_DIR.glob('*.scm')):
+        hasher.update(query_file.name.encode())
+        hasher.update(query_file.read_bytes())
+    return hasher.hexdigest()
+
+
+class TagCache:
+    """Persistent store of extracted tags keyed by (language, git blob SHA).
+
+    Entries are dropped wholesale whenever the cache version (query files, tree-sitter
+    versions) differs from the one the database was written with.
+    """
+
+    def __init__(self, db_path: str, flush_every: int = 500) -> None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.flush_every = flush_every
+        self.version = get_cache_version()
+
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, str], str] = {}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS tags ('
+            'lang TEXT NOT NULL, blob_sha TEXT NOT NULL, tags TEXT NOT NULL, '
+            'PRIMARY KEY (lang, blob_sha))'
+        )
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'version'"
+        ).fetchone()
+        if row is None or row[0] != self.version:
+            self._conn.execute('DELETE FROM tags')
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                (self.version,),
+            )
+        self._conn.commit()
+
+    def get(self, lang: str, blob_sha: str) -> list[CompactTag] | None:
+        with self._lock:
+            serialized = self._pending.get((lang, blob_sha))
+            if serialized is None:
+                row = self._conn.execute(
+                    'SELECT tags FROM tags WHERE lang = ? AND blob_sha = ?',
+                    (lang, blob_sha),
+                ).fetchone()
+                if row is None:
+                    return None
+                serialized = row[0]
+        return [tuple(tag) for tag in json.loads(serialized)]  # type: ignore[misc]
+
+    def put(self, lang: str, blob_sha: str, tags: list[CompactTag]) -> None:
+        with self._lock:
+            self._pending[(lang, blob_sha)] = json.dumps(tags, separators=(',', ':'))
+            should_flush = len(self._pending) >= self.flush_every
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO tags (lang, blob_sha, tags) VALUES (?, ?, ?)',
+                [(lang, sha, tags) for (lang, sha), tags in self._pending.items()],
+            )
+            self._conn.commit()
+            self._pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,52 @@
+import math
+from collections.abc import Iterator
+from concurrent.futures import Executor
+
+from locify.tree_sitter.cache import CompactTag
+from locify.tree_sitter.parser import TreeSitterParser, to_compact_tag
+
+MAX_CHUNK_SIZE = 64
+
+# Each worker process keeps its own parser, so languages and queries are compiled once
+# per worker rather than once per file or chunk
+_worker_parser: TreeSitterParser | None = None
+
+
+def init_parser_worker() -> None:
+    global _worker_parser
+    _worker_parser = TreeSitterParser()
+
+
+def parse_files_chunk(
+    files: list[tuple[str, str]],
+) -> list[list[CompactTag] | None]:
+    global _worker_parser
+    if _worker_parser is None:
+        _worker_parser = TreeSitterParser()
+
+    results: list[list[CompactTag] | None] = []
+    for abs_path, rel_path in files:
+        parsed_tags = _worker_parser.parse_tags(abs_path, rel_path)
+        results.append(
+            None
+            if parsed_tags is None
+            else [to_compact_tag(tag) for tag in parsed_tags]
+        )
+    return results
+
+
+def parse_files_in_parallel(
+    executor: Executor, files: list[tuple[str, str]], workers: int
+) -> Iterator[list[CompactTag] | None]:
+    """Parse (absolute path, relative path) pairs on the executor, in input order.
+
+    Yields the compact tags of each file, or None where `TreeSitterParser.parse_tags` would.
+    """
+    if not files:
+        return
+
+    # A few chunks per worker keeps them all busy without paying IPC cost per file
+    chunk_size = max(1, min(MAX_CHUNK_SIZE, math.ceil(len(files) / (workers * 4))))
+    chunks = [files[i : i + chunk_size] for i in range(0, len(files), chunk_size)]
+    for chunk_results in executor.map(parse_files_chunk, chunks):
+        yield from chunk_results
@@ -6,6 +6,7 @@ from pathlib import Path
 from grep_ast import filename_to_lang
 from tree_sitter_languages import get_language, get_parser
 
+from locify.tree_sitter.cache import QUERIES_DIR, CompactTag, TagCache
 from locify.utils.file import read_text
 
 # warnings.simplefilter('ignore', category=FutureWarning)
@@ -15,41 +16,116 @@ ParsedTag = namedtuple(
 )
 
 
+# Compiled tree-sitter objects of a language, loaded once and reused for every file
+LanguageEntry = namedtuple('LanguageEntry', ('language', 'parser', 'query'))
+
+
 class TagKind(Enum):
     DEF = 'def'
     REF = 'ref'
 
 
 class TreeSitterParser:
-    def __init__(self) -> None:
-        pass
+    def __init__(self, tag_cache: TagCache | None = None) -> None:
+        self.tag_cache = tag_cache
+
+        # language name -> compiled objects, or None if the language has no tags query
+        self._lang_registry: dict[str, LanguageEntry | None] = {}
+        self.registry_hits = 0
+        self.registry_misses = 0
+
+    def get_language_entry(self, lang: str) -> LanguageEntry | None:
+        if lang in self._lang_registry:
+            self.registry_hits += 1
+            return self._lang_registry[lang]
+
+        self.registry_misses += 1
+        tags_file_path = QUERIES_DIR / f'tree-sitter-{lang}-tags.scm'
+        entry = None
+        if tags_file_path.exists():
+            ts_language = get_language(lang)
+            entry = LanguageEntry(
+                language=ts_language,
+                parser=get_parser(lang),
+                query=ts_language.query(tags_file_path.read_text()),
+            )
+        self._lang_registry[lang] = entry
+        return entry
+
+    def get_registry_stats(self) -> dict[str, int]:
+        return {
+            'hits': self.registry_hits,
+            'misses': self.registry_misses,
+            'languages': sum(
+                entry is not None for entry in self._lang_registry.values()
+            ),
+        }
+
+    def get_tags_from_file(
+        self, abs_path: str, rel_path: str, blob_sha: str | None = None
+    ) -> list[ParsedTag]:
+        cached_tags = self.get_cached_tags(abs_path, rel_path, blob_sha)
+        if cached_tags is not None:
+            return cached_tags
+
+        parsed_tags = self.parse_tags(abs_path, rel_path)
+        if parsed_tags is None:
+            return []
 
-    def get_tags_from_file(self, abs_path: str, rel_path: str) -> list[ParsedTag]:
+        self.put_cached_tags(abs_path, blob_sha, parsed_tags)
+        return parsed_tags
+
+    def get_cached_tags(
+        self, abs_path: str, rel_path: str, blob_sha: str | None
+    ) -> list[ParsedTag] | None:
+        if self.tag_cache is None or not blob_sha:
+            return None
         lang = filename_to_lang(abs_path)
         if not lang:
-            return []
+            return None
+
+        cached_tags = self.tag_cache.get(lang, blob_sha)
+        if cached_tags is None:
+            return None
+        return [
+            from_compact_tag(compact_tag, rel_path, abs_path)
+            for compact_tag in cached_tags
+        ]
+
+    def put_cached_tags(
+        self, abs_path: str, blob_sha: str | None, parsed_tags: list[ParsedTag]
+    ) -> None:
+        if self.tag_cache is None or not blob_sha:
+            return
+        lang = filename_to_lang(abs_path)
+        if not lang:
+            return
+        self.tag_cache.put(lang, blob_sha, [to_compact_tag(tag) for tag in parsed_tags])
 
-        ts_language = get_language(lang)
-        ts_parser = get_parser(lang)
+    def parse_tags(self, abs_path: str, rel_path: str) -> list[ParsedTag] | None:
+        """Parse the tags of a file, or return None if it cannot be parsed at all.
 
-        tags_file_path = (
-            Path(__file__).resolve().parent / 'queries' / f'tree-sitter-{lang}-tags.scm'
-        )
-        if not tags_file_path.exists():
-            return []
-        tags_query = tags_file_path.read_text()
+        Unlike an empty list, None results (unsupported language, missing file) must not be
+        cached.
+        """
+        lang = filename_to_lang(abs_path)
+        if not lang:
+            return None
+
+        lang_entry = self.get_language_entry(lang)
+        if lang_entry is None:
+            return None
 
         if not Path(abs_path).exists():
-            return []
+            return None
         code = read_text(abs_path)
         if not code:
             return []
 
-        parsed_tree = ts_parser.parse(bytes(code, 'utf-8'))
+        parsed_tree = lang_entry.parser.parse(bytes(code, 'utf-8'))
 
         # Run the tags queries
-        query = ts_language.query(tags_query)
-        captures = query.captures(parsed_tree.root_node)
+        captures = lang_entry.query.captures(parsed_tree.root_node)
 
         parsed_tags = []
         for node, tag_str in captures:
@@ -73,3 +149,20 @@ class TreeSitterParser:
             parsed_tags.append(result_tag)
 
         return parsed_tags
+
+
+def to_compact_tag(tag: ParsedTag) -> CompactTag:
+    return (tag.start_line, tag.node_name, tag.tag_kind.value)
+
+
+def from_compact_tag(
+    compact_tag: CompactTag, rel_path: str, abs_path: str
+) -> ParsedTag:
+    start_line, node_name, tag_kind = compact_tag
+    return ParsedTag(
+        rel_path=rel_path,
+        abs_path=abs_path,
+        start_line=start_line,
+        node_name=node_name,
+        tag_kind=TagKind(tag_kind),
+    )
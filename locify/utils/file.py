@@ -1,14 +1,30 @@
+import hashlib
+import os
 from pathlib import Path
 
 from git import Repo
 
-from locify.utils.path import get_depth_of_rel_path, has_image_extension
+from locify.utils.git_index import parse_ls_files_stage_output, read_git_index
+from locify.utils.path import has_image_extension
+from locify.utils.tracked_files import TrackedFileIndex
+
+# 'traverse' lists the files of the HEAD tree with GitPython. 'index' reads the git index
+# file directly, falling back to 'ls-files', which parses `git ls-files -z --stage`. Both
+# list the files of the index, so unlike 'traverse' they include staged additions.
+FILE_LISTING_BACKENDS = ('traverse', 'index', 'ls-files')
 
 
 class GitRepoUtils:
-    def __init__(self, abs_repo_path: str) -> None:
+    def __init__(
+        self, abs_repo_path: str, file_listing_backend: str = 'traverse'
+    ) -> None:
         if not Path(abs_repo_path).is_absolute():
             raise ValueError('The path must be absolute')
+        if file_listing_backend not in FILE_LISTING_BACKENDS:
+            raise ValueError(
+                f"Invalid file listing backend: {file_listing_backend}. Available backends are: {', '.join(repr(b) for b in FILE_LISTING_BACKENDS)}"
+            )
+        self.file_listing_backend = file_listing_backend
 
         self.repo_path = Path(abs_repo_path)
         try:
@@ -18,12 +34,63 @@ class GitRepoUtils:
 
         # TODO: use BFS to traverse subdirectories to find if there are any git repositories in them
 
-    def get_all_absolute_tracked_files(self, depth: int | None = None) -> list[str]:
+        self._tracked_file_index: TrackedFileIndex | None = None
+        self._tracked_file_index_key: tuple[str, int] | None = None
+
+    def get_tracked_file_index(self) -> TrackedFileIndex:
+        """Index of the tracked files, rebuilt only when HEAD or the git index change."""
+        try:
+            index_mtime_ns = self._get_index_path().stat().st_mtime_ns
+        except OSError:
+            index_mtime_ns = -1
+        try:
+            head_commit_sha = self.get_head_commit_sha()
+        except ValueError:  # No commits yet
+            head_commit_sha = ''
+        key = (head_commit_sha, index_mtime_ns)
+        if self._tracked_file_index is None or self._tracked_file_index_key != key:
+            tracked_files = self.list_tracked_files()
+            self._tracked_file_index = TrackedFileIndex(
+                [rel_path for rel_path, _ in tracked_files],
+                [blob_sha for _, blob_sha in tracked_files],
+            )
+            self._tracked_file_index_key = key
+        return self._tracked_file_index
+
+    def list_tracked_files(self) -> list[tuple[str, str]]:
+        """List the (relative path, blob SHA) of tracked files with the configured backend."""
+        if self.file_listing_backend == 'index' and self._can_read_index():
+            try:
+                return read_git_index(self._get_index_path())
+            except FileNotFoundError:
+                return []
+            except ValueError:
+                pass  # Split or sparse index, let git resolve it
+        if self.file_listing_backend in ('index', 'ls-files'):
+            return parse_ls_files_stage_output(self.repo.git.ls_files('-z', '--stage'))
+
+        if not self.repo.head.is_valid():
+            return []
         return [
-            str(self.repo_path / item.path)
+            (item.path, item.hexsha)
             for item in self.repo.tree().traverse()
             if item.type == 'blob'
-            and (not depth or get_depth_of_rel_path(item.path) <= depth)
+        ]
+
+    def _get_index_path(self) -> Path:
+        return Path(self.repo.git_dir) / 'index'
+
+    def _can_read_index(self) -> bool:
+        # Index entries hold SHA-1s, unless the repository uses another object format
+        object_format = self.repo.config_reader().get_value(
+            'extensions', 'objectformat', 'sha1'
+        )
+        return object_format == 'sha1'
+
+    def get_all_absolute_tracked_files(self, depth: int | None = None) -> list[str]:
+        return [
+            str(self.repo_path / rel_path)
+            for rel_path in self.get_tracked_file_index().get_rel_paths(depth=depth)
         ]
 
     def get_all_absolute_staged_files(self) -> list[str]:
@@ -31,100 +98,66 @@ class GitRepoUtils:
             str(self.repo_path / item.a_path) for item in self.repo.index.diff('HEAD')
         ]
 
+    def get_all_absolute_unstaged_files(self) -> list[str]:
+        return [
+            str(self.repo_path / item.a_path) for item in self.repo.index.diff(None)
+        ]
+
+    def get_all_absolute_modified_files(self) -> set[str]:
+        return set(self.get_all_absolute_staged_files()) | set(
+            self.get_all_absolute_unstaged_files()
+        )
+
+    def get_head_commit_sha(self) -> str:
+        return self.repo.head.commit.hexsha
+
+    def get_absolute_files_changed_between(
+        self, old_commit_sha: str, new_commit_sha: str
+    ) -> set[str]:
+        changed_files = set()
+        for item in self.repo.commit(old_commit_sha).diff(new_commit_sha):
+            for path in (item.a_path, item.b_path):
+                if path:
+                    changed_files.add(str(self.repo_path / path))
+        return changed_files
+
+    def get_all_tracked_blob_shas(self) -> dict[str, str]:
+        """Map each tracked file's absolute path to the blob SHA of its worktree content."""
+        tracked_file_index = self.get_tracked_file_index()
+        blob_shas = {
+            str(self.repo_path / rel_path): blob_sha
+            for rel_path, blob_sha in zip(
+                tracked_file_index.rel_paths, tracked_file_index.blob_shas
+            )
+        }
+
+        # The SHAs recorded in HEAD are stale for files with staged or unstaged changes
+        for abs_path in self.get_all_absolute_modified_files():
+            if abs_path not in blob_shas:
+                continue
+            blob_sha = get_blob_sha_of_file(abs_path)
+            if blob_sha:
+                blob_shas[abs_path] = blob_sha
+            else:
+                del blob_shas[abs_path]
+        return blob_shas
+
     def get_absolute_tracked_files_in_directory(
         self, rel_dir_path: str, depth: int | None = None
     ) -> list[str]:
-        rel_dir_path = rel_dir_path.rstrip('/')
         return [
-            str(self.repo_path / item.path)
-            for item in self.repo.tree().traverse()
-            if item.path.startswith(rel_dir_path + '/')
-            and item.type == 'blob'
-            and (not depth or get_depth_of_rel_path(item.path) <= depth)
+            str(self.repo_path / rel_path)
+            for rel_path in self.get_tracked_file_index().get_rel_paths(
+                rel_dir_path=rel_dir_path, depth=depth
+            )
         ]
 
     def get_tracked_files_tree(
         self, rel_dir_path: str = '', depth: int | None = None
     ) -> str:
-        def get_dir_at_depth(file_path: Path, max_depth: int) -> Path | None:
-            """Get the directory at the specified depth if the file is deeper."""
-            parts = file_path.parts
-            if len(parts) > max_depth:  # Depth starts from 1
-                return Path(*parts[:max_depth])
-            return None
-
-        def build_tree(files: list[Path]) -> dict:
-            """Build a tree structure from list of paths."""
-            tree: dict = {}
-
-            # If depth is specified, collect directories at depth limit
-            if depth is not None:
-                deep_dirs = set()
-                for file_path in files:
-                    dir_at_depth = get_dir_at_depth(file_path, depth)
-                    if dir_at_depth:
-                        deep_dirs.add(dir_at_depth)
-
-                # Add truncated paths for deep files
-                processed_files = []
-                for file_path in files:
-                    if len(file_path.parts) > depth:
-                        if Path(*file_path.parts[:depth]) not in deep_dirs:
-                            deep_dirs.add(Path(*file_path.parts[:depth]))
-                    else:
-                        processed_files.append(file_path)
-
-                # Combine regular files with directories at depth limit
-                all_paths = list(processed_files) + list(deep_dirs)
-            else:
-                all_paths = list(files)
-
-            # Build the tree
-            for path in sorted(all_paths):
-                current = tree
-                for part in path.parts:
-                    if part not in current:
-                        current[part] = {}
-                    current = current[part]
-
-            return tree
-
-        def build_tree_string(
-            tree: dict, prefix: str = '', current_depth: int = 1
-        ) -> str:
-            """Build the tree structure as a string recursively."""
-            if depth is not None and current_depth > depth:
-                return ''
-
-            result = []
-            items = sorted(tree.items())
-            for i, (name, subtree) in enumerate(items):
-                is_last = i == len(items) - 1
-                result.append(f"{prefix}{'└── ' if is_last else '├── '}{name}\n")
-
-                if subtree and (depth is None or current_depth < depth):
-                    new_prefix = prefix + ('    ' if is_last else '│   ')
-                    result.append(
-                        build_tree_string(subtree, new_prefix, current_depth + 1)
-                    )
-
-            return ''.join(result)
-
-        # Get tracked files
-        tracked_files = set()
-        for item in self.repo.tree().traverse():
-            if item.type == 'blob':
-                if rel_dir_path:
-                    if item.path.startswith(rel_dir_path + '/'):
-                        file_path = Path(item.path)
-                        tracked_files.add(file_path)
-                else:
-                    file_path = Path(item.path)
-                    tracked_files.add(file_path)
-
-        # Build and return the tree string
-        tree = build_tree(list(tracked_files))
-        return build_tree_string(tree)
+        return self.get_tracked_file_index().render_tree(
+            rel_dir_path=rel_dir_path, depth=depth
+        )
 
 
 def read_text(abs_path: str) -> str:
@@ -133,3 +166,21 @@ def read_text(abs_path: str) -> str:
 
     with open(abs_path, 'r') as f:
         return f.read()
+
+
+def get_blob_sha_of_file(abs_path: str) -> str | None:
+    """Compute the git blob SHA of a file's content, like `git hash-object`."""
+    try:
+        data = Path(abs_path).read_bytes()
+    except OSError:
+        return None
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+def get_file_stat(abs_path: str) -> tuple[int, int]:
+    """(modification time in ns, size) of a file, or (-1, -1) if it cannot be read."""
+    try:
+        file_stat = os.stat(abs_path)
+    except OSError:
+        return (-1, -1)
+    return (file_stat.st_mtime_ns, file_stat.st_size)
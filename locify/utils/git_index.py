@@ -0,0 +1,93 @@
+import struct
+from pathlib import Path
+
+INDEX_SIGNATURE = b'DIRC'
+SUPPORTED_INDEX_VERSIONS = (2, 3, 4)
+# ctime, mtime, dev, ino, mode, uid, gid, size (4 bytes each), SHA-1, flags
+ENTRY_HEADER = struct.Struct('>24x I 12x 20s H')
+ENTRY_HEADER_SIZE = 62
+EXTENDED_FLAG = 0x4000
+STAGE_MASK = 0x3000
+GITLINK_MODE = 0o160000
+# Extensions without which the entries of the index are incomplete
+UNSUPPORTED_EXTENSIONS = (b'link', b'sdir')
+
+
+def read_git_index(index_path: str | Path) -> list[tuple[str, str]]:
+    """Read the (relative path, blob SHA) of the files in a git index, in index order.
+
+    Parses the index file directly (versions 2 to 4), which is much faster than listing
+    the files of a tree with GitPython. Submodules and conflicting higher-stage entries
+    are skipped. Raises `ValueError` for indexes that cannot be read on their own, e.g.
+    split or sparse indexes.
+    """
+    data = Path(index_path).read_bytes()
+    if data[:4] != INDEX_SIGNATURE:
+        raise ValueError(f'Not a git index file: {index_path}')
+    version, num_entries = struct.unpack_from('>II', data, 4)
+    if version not in SUPPORTED_INDEX_VERSIONS:
+        raise ValueError(f'Unsupported git index version: {version}')
+
+    files: list[tuple[str, str]] = []
+    pos = 12
+    prev_path = b''
+    for _ in range(num_entries):
+        entry_start = pos
+        mode, sha, flags = ENTRY_HEADER.unpack_from(data, pos)
+        pos += ENTRY_HEADER_SIZE
+        if version >= 3 and flags & EXTENDED_FLAG:
+            pos += 2
+
+        if version == 4:
+            # Path prefix-compressed against the previous entry, not padded
+            num_stripped, pos = read_offset_varint(data, pos)
+            path_end = data.index(b'\0', pos)
+            path = prev_path[: len(prev_path) - num_stripped] + data[pos:path_end]
+            pos = path_end + 1
+            prev_path = path
+        else:
+            path_end = data.index(b'\0', pos)
+            path = data[pos:path_end]
+            # Entries are NUL-padded to a multiple of 8 bytes
+            pos = entry_start + ((path_end - entry_start + 8) & ~7)
+
+        if mode == GITLINK_MODE or flags & STAGE_MASK:
+            continue
+        files.append((path.decode('utf-8', 'surrogateescape'), sha.hex()))
+
+    # Extensions follow the entries, up to the trailing checksum
+    while pos + 8 <= len(data) - 20:
+        signature = data[pos : pos + 4]
+        (size,) = struct.unpack_from('>I', data, pos + 4)
+        if signature in UNSUPPORTED_EXTENSIONS:
+            raise ValueError(
+                f'Unsupported git index extension: {signature.decode(errors="replace")}'
+            )
+        pos += 8 + size
+    return files
+
+
+def read_offset_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """Decode git's offset varint encoding, returning the value and the next position."""
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+
+def parse_ls_files_stage_output(output: str) -> list[tuple[str, str]]:
+    """Parse the (relative path, blob SHA) of files from `git ls-files -z --stage` output."""
+    files = []
+    for record in output.split('\0'):
+        if not record:
+            continue
+        info, path = record.split('\t', 1)
+        mode, sha, stage = info.split(' ')
+        if int(mode, 8) == GITLINK_MODE or stage != '0':
+            continue
+        files.append((path, sha))
+    return files
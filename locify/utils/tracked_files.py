@@ -0,0 +1,101 @@
+from collections.abc import Iterator
+
+# Directory name -> subtree, or file name -> index of the file in `TrackedFileIndex.rel_paths`
+TrieNode = dict[str, 'TrieNode | int']
+
+
+class TrackedFileIndex:
+    """Snapshot of the tracked files of a repository, with a trie of their directories.
+
+    Directory lookups walk the trie in O(depth of the directory) before collecting the files
+    below it, instead of scanning every tracked path. Files are always returned in their
+    original order.
+    """
+
+    def __init__(self, rel_paths: list[str], blob_shas: list[str]) -> None:
+        self.rel_paths = rel_paths
+        self.blob_shas = blob_shas
+        self.trie: TrieNode = {}
+        for file_id, rel_path in enumerate(rel_paths):
+            *dir_names, file_name = rel_path.split('/')
+            node = self.trie
+            for dir_name in dir_names:
+                child = node.setdefault(dir_name, {})
+                assert isinstance(child, dict)
+                node = child
+            node[file_name] = file_id
+
+    def __len__(self) -> int:
+        return len(self.rel_paths)
+
+    def get_dir_node(self, rel_dir_path: str) -> TrieNode | None:
+        node = self.trie
+        for dir_name in split_rel_dir_path(rel_dir_path):
+            child = node.get(dir_name)
+            if not isinstance(child, dict):
+                return None
+            node = child
+        return node
+
+    def get_rel_paths(
+        self, rel_dir_path: str = '', depth: int | None = None
+    ) -> list[str]:
+        """Tracked files below a directory, at most `depth` levels deep from the root."""
+        dir_names = split_rel_dir_path(rel_dir_path)
+        if not dir_names and not depth:
+            return list(self.rel_paths)
+
+        node = self.get_dir_node(rel_dir_path)
+        if node is None:
+            return []
+        file_ids = sorted(iter_file_ids(node, len(dir_names) + 1, depth))
+        return [self.rel_paths[file_id] for file_id in file_ids]
+
+    def render_tree(self, rel_dir_path: str = '', depth: int | None = None) -> str:
+        """Render the tracked files below a directory, including its ancestors, as a tree."""
+        dir_names = split_rel_dir_path(rel_dir_path)
+        node = self.get_dir_node(rel_dir_path)
+        if not node:
+            return ''
+        for dir_name in reversed(dir_names):
+            node = {dir_name: node}
+
+        def build_tree_string(node: TrieNode, prefix: str, current_depth: int) -> str:
+            if depth is not None and current_depth > depth:
+                return ''
+
+            result = []
+            items = sorted(node.items())
+            for i, (name, subtree) in enumerate(items):
+                is_last = i == len(items) - 1
+                result.append(f"{prefix}{'└── ' if is_last else '├── '}{name}\n")
+
+                if isinstance(subtree, dict) and (
+                    depth is None or current_depth < depth
+                ):
+                    new_prefix = prefix + ('    ' if is_last else '│   ')
+                    result.append(
+                        build_tree_string(subtree, new_prefix, current_depth + 1)
+                    )
+
+            return ''.join(result)
+
+        return build_tree_string(node, '', 1)
+
+
+def iter_file_ids(
+    node: TrieNode, node_depth: int, max_depth: int | None = None
+) -> Iterator[int]:
+    """Yield the ids of the files in a subtree whose children are `node_depth` deep."""
+    if max_depth and node_depth > max_depth:
+        return
+    for child in node.values():
+        if isinstance(child, dict):
+            yield from iter_file_ids(child, node_depth + 1, max_depth)
+        else:
+            yield child
+
+
+def split_rel_dir_path(rel_dir_path: str) -> list[str]:
+    rel_dir_path = rel_dir_path.strip('/')
+    return rel_dir_path.split('/') if rel_dir_path else []
@@ -1,8 +1,10 @@
+import asyncio
 import subprocess
 from pathlib import Path
 
 import pytest
 
+from locify.indexing.full_map import strategy as full_map_strategy
 from locify.indexing.full_map.strategy import FullMapStrategy
 from locify.utils.llm import get_token_count_from_text
 
@@ -54,3 +56,119 @@ def test_full_map_strategy_integration(setup_git_repo):
 
     # Ensure the token count is a reasonable positive integer
     assert token_count > 0
+
+
+def test_full_map_strategy_with_tag_cache(setup_git_repo):
+    repo_path = setup_git_repo
+
+    uncached_map = FullMapStrategy(root=str(repo_path)).get_map()
+
+    # The first run populates the cache, the second one is served from it
+    cold_map = FullMapStrategy(root=str(repo_path), use_cache=True).get_map()
+    assert (repo_path / '.locify' / 'tags.db').exists()
+    warm_map = FullMapStrategy(root=str(repo_path), use_cache=True).get_map()
+
+    assert cold_map == uncached_map
+    assert warm_map == uncached_map
+
+
+def test_full_map_strategy_with_workers(setup_git_repo):
+    repo_path = setup_git_repo
+
+    serial_map = FullMapStrategy(root=str(repo_path)).get_map()
+
+    strategy = FullMapStrategy(root=str(repo_path), workers=2)
+    parallel_map = strategy.get_map()
+    strategy.close()
+
+    assert parallel_map == serial_map
+
+
+def test_full_map_strategy_with_max_tokens(setup_git_repo):
+    repo_path = setup_git_repo
+    strategy = FullMapStrategy(root=str(repo_path))
+
+    map_output = strategy.get_map(max_tokens=20)
+
+    assert get_token_count_from_text(strategy.model_name, map_output) <= 20
+    assert 'test_file1.py' in map_output
+    assert 'test_file2.py' not in map_output
+    assert strategy.get_map(max_tokens=0) == ''
+
+
+def test_full_map_strategy_render_cache(setup_git_repo, monkeypatch):
+    repo_path = setup_git_repo
+    strategy = FullMapStrategy(root=str(repo_path))
+
+    num_contexts = 0
+    original_tree_context = full_map_strategy.TreeContext
+
+    def counting_tree_context(*args, **kwargs):
+        nonlocal num_contexts
+        num_contexts += 1
+        return original_tree_context(*args, **kwargs)
+
+    monkeypatch.setattr(full_map_strategy, 'TreeContext', counting_tree_context)
+
+    map_output = strategy.get_map()
+    assert num_contexts == 2
+    assert strategy.get_map() == map_output
+    assert num_contexts == 2
+
+    # Other lines of interest reuse the parsed context of the same content
+    abs_file = str(repo_path / 'test_file1.py')
+    strategy.render_tree(abs_file, 'test_file1.py', [1])
+    assert num_contexts == 2
+
+    # Changed content is parsed again
+    (repo_path / 'test_file1.py').write_text('def baz():\n    pass\n')
+    assert 'baz' in strategy.render_tree(abs_file, 'test_file1.py', [0])
+    assert num_contexts == 3
+
+    uncached_strategy = FullMapStrategy(root=str(repo_path), render_cache_bytes=0)
+    assert uncached_strategy.get_map() == strategy.get_map()
+
+
+def test_full_map_strategy_iter_map(setup_git_repo, capsys):
+    repo_path = setup_git_repo
+    strategy = FullMapStrategy(root=str(repo_path))
+
+    chunks = list(strategy.iter_map())
+    assert [chunk.split(':\n')[0] for chunk in chunks] == [
+        'test_file1.py',
+        'test_file2.py',
+    ]
+    assert '\n'.join(chunks) == strategy.get_map()
+    assert '\n'.join(strategy.iter_map(max_tokens=20)) == strategy.get_map(
+        max_tokens=20
+    )
+
+    strategy.stream_map()
+    assert capsys.readouterr().out == strategy.get_map() + '\n'
+
+
+def test_full_map_strategy_iter_map_renders_lazily(setup_git_repo, monkeypatch):
+    repo_path = setup_git_repo
+    strategy = FullMapStrategy(root=str(repo_path))
+    rendered_files = []
+    original_render_file_chunk = strategy.render_file_chunk
+
+    def spy_render_file_chunk(abs_file, rel_file, lois):
+        rendered_files.append(rel_file)
+        return original_render_file_chunk(abs_file, rel_file, lois)
+
+    monkeypatch.setattr(strategy, 'render_file_chunk', spy_render_file_chunk)
+
+    map_chunks = strategy.iter_map()
+    assert next(map_chunks).startswith('test_file1.py:')
+    assert rendered_files == ['test_file1.py']
+
+
+def test_full_map_strategy_async_api(setup_git_repo):
+    repo_path = setup_git_repo
+    strategy = FullMapStrategy(root=str(repo_path))
+
+    async_map = asyncio.run(strategy.aget_map())
+    strategy.close()
+
+    assert async_map == strategy.get_map()
@@ -1,4 +1,6 @@
+import asyncio
 import subprocess
+import threading
 from pathlib import Path
 
 import pytest
@@ -114,3 +116,372 @@ def test_repo_map_strategy_get_ranked_tags_with_refs(setup_git_repo_with_refs):
 test_file2.py:
 ...⋮..."""
     assert repo_map == expected_map
+
+
+def test_repo_map_strategy_with_workers(setup_git_repo_with_refs):
+    repo_path = setup_git_repo_with_refs
+
+    serial_tags = RepoMapStrategy(root=str(repo_path)).get_ranked_tags()
+
+    strategy = RepoMapStrategy(root=str(repo_path), workers=2)
+    parallel_tags = strategy.get_ranked_tags()
+    strategy.close()
+
+    assert parallel_tags == serial_tags
+
+
+def _count_parsed_files(strategy: RepoMapStrategy) -> list[str]:
+    parsed_rel_files: list[str] = []
+    get_tags_from_file = strategy.ts_parser.get_tags_from_file
+
+    def counting_get_tags_from_file(abs_path, rel_path, blob_sha=None):
+        parsed_rel_files.append(rel_path)
+        return get_tags_from_file(abs_path, rel_path, blob_sha=blob_sha)
+
+    strategy.ts_parser.get_tags_from_file = counting_get_tags_from_file  # type: ignore[method-assign]
+    return parsed_rel_files
+
+
+def test_repo_map_strategy_incremental(setup_git_repo_with_refs):
+    repo_path = setup_git_repo_with_refs
+    (repo_path / 'test_file3.py').write_text('def baz():\n    pass\n')
+    run_git_command(repo_path, ['git', 'add', '.'])
+    run_git_command(repo_path, ['git', 'commit', '-m', 'Add test_file3'])
+
+    strategy = RepoMapStrategy(root=str(repo_path), incremental=True)
+    parsed_rel_files = _count_parsed_files(strategy)
+    strategy.get_ranked_tags()
+    assert len(parsed_rel_files) == 3
+
+    # Nothing changed: nothing is parsed again
+    parsed_rel_files.clear()
+    strategy.get_ranked_tags()
+    assert parsed_rel_files == []
+
+    # Unstaged edit: only the edited file is parsed again
+    (repo_path / 'test_file2.py').write_text(
+        'from test_file1 import foo, bar\nfrom test_file3 import baz\n\n'
+        + 'foo()\n' * 4
+        + 'bar()\n'
+        + 'baz()\n' * 9
+    )
+    incremental_tags = strategy.get_ranked_tags()
+    assert parsed_rel_files == ['test_file2.py']
+    assert incremental_tags == RepoMapStrategy(root=str(repo_path)).get_ranked_tags()
+    assert {tag.node_name for tag in incremental_tags} == {
+        'foo',
+        'bar',
+        'baz',
+        'NO_NAME',
+    }
+
+    # Committing the edit and deleting a file in a new commit
+    parsed_rel_files.clear()
+    run_git_command(repo_path, ['git', 'add', '.'])
+    run_git_command(repo_path, ['git', 'commit', '-m', 'Reference baz'])
+    run_git_command(repo_path, ['git', 'rm', '-q', 'test_file3.py'])
+    run_git_command(repo_path, ['git', 'commit', '-m', 'Remove test_file3'])
+    incremental_tags = strategy.get_ranked_tags()
+    assert parsed_rel_files == []
+    assert incremental_tags == RepoMapStrategy(root=str(repo_path)).get_ranked_tags()
+    assert 'test_file3.py' not in {tag.rel_path for tag in incremental_tags}
+
+
+@pytest.fixture
+def setup_git_repo_with_many_refs(tmp_path):
+    repo_path = tmp_path / 'repo'
+    repo_path.mkdir()
+    run_git_command(repo_path, ['git', 'init'])
+
+    (repo_path / 'models.py').write_text(
+        'class User:\n    pass\n\nclass Order:\n    pass\n\ndef make_user():\n    return User()\n'
+    )
+    (repo_path / 'service.py').write_text(
+        'from models import User, Order, make_user\n\n'
+        'def create_order():\n    make_user()\n    make_user()\n    return Order()\n'
+    )
+    (repo_path / 'api.py').write_text(
+        'from service import create_order\n\n'
+        'def handle():\n    create_order()\n    create_order()\n    create_order()\n'
+    )
+    (repo_path / 'cli.py').write_text(
+        'from api import handle\nfrom models import User\n\n'
+        'def main():\n    handle()\n    User()\n'
+    )
+    run_git_command(repo_path, ['git', 'add', '.'])
+    run_git_command(repo_path, ['git', 'commit', '-m', 'Initial commit'])
+    return repo_path
+
+
+@pytest.mark.parametrize(
+    'mentioned_rel_files, mentioned_idents',
+    [(None, None), ({'cli.py'}, None), (None, {'Order'}), ({'api.py'}, {'User'})],
+)
+def test_repo_map_strategy_pagerank_backends_are_equivalent(
+    setup_git_repo_with_many_refs, mentioned_rel_files, mentioned_idents
+):
+    repo_path = setup_git_repo_with_many_refs
+    sparse_strategy = RepoMapStrategy(root=str(repo_path))
+    networkx_strategy = RepoMapStrategy(
+        root=str(repo_path), pagerank_backend='networkx'
+    )
+
+    sparse_tags = sparse_strategy.get_ranked_tags(
+        mentioned_rel_files=mentioned_rel_files, mentioned_idents=mentioned_idents
+    )
+    networkx_tags = networkx_strategy.get_ranked_tags(
+        mentioned_rel_files=mentioned_rel_files, mentioned_idents=mentioned_idents
+    )
+    assert sparse_tags == networkx_tags
+
+    sparse_scores, sparse_ident_scores = sparse_strategy._rank_with_sparse_matrix(
+        dict.fromkeys(mentioned_rel_files or [], 1.0), mentioned_idents or set()
+    )
+    networkx_scores, networkx_ident_scores = networkx_strategy._rank_with_networkx(
+        dict.fromkeys(mentioned_rel_files or [], 1.0), mentioned_idents or set()
+    )
+    assert sparse_scores == pytest.approx(networkx_scores, abs=1e-9)
+    assert sparse_ident_scores == pytest.approx(dict(networkx_ident_scores), abs=1e-9)
+
+
+def test_repo_map_strategy_invalid_pagerank_backend(setup_git_repo_with_refs):
+    with pytest.raises(ValueError):
+        RepoMapStrategy(root=str(setup_git_repo_with_refs), pagerank_backend='igraph')
+
+
+def test_repo_map_strategy_reuses_rank_matrix_between_calls(
+    setup_git_repo_with_many_refs,
+):
+    repo_path = setup_git_repo_with_many_refs
+    strategy = RepoMapStrategy(root=str(repo_path), incremental=True)
+
+    strategy.get_ranked_tags(mentioned_rel_files={'cli.py'})
+    rank_matrix = strategy._get_rank_matrix(set())
+    cold_iterations = strategy.last_pagerank_iterations
+
+    # Same graph and personalization: the previous scores are reused
+    strategy.get_ranked_tags(mentioned_rel_files={'cli.py'})
+    assert strategy._get_rank_matrix(set()) is rank_matrix
+    assert strategy.last_pagerank_iterations == 0 < cold_iterations
+
+    # Only the personalization changes: same matrix, same result as a cold ranking
+    warm_tags = strategy.get_ranked_tags(mentioned_rel_files={'api.py'})
+    assert strategy._get_rank_matrix(set()) is rank_matrix
+    assert warm_tags == RepoMapStrategy(root=str(repo_path)).get_ranked_tags(
+        mentioned_rel_files={'api.py'}
+    )
+
+    # Boosting identifiers uses a separate cached matrix
+    strategy.get_ranked_tags(mentioned_idents={'User'})
+    assert strategy._get_rank_matrix({'User'}) is not rank_matrix
+    assert strategy._get_rank_matrix({'User', 'unknown'}) is strategy._get_rank_matrix(
+        {'User'}
+    )
+
+
+def test_repo_map_strategy_get_map_with_max_tokens(setup_git_repo_with_many_refs):
+    repo_path = setup_git_repo_with_many_refs
+    strategy = RepoMapStrategy(root=str(repo_path))
+    full_map = strategy.get_map()
+    full_token_count = get_token_count_from_text(strategy.model_name, full_map)
+
+    # A budget that fits everything gives the full map
+    assert strategy.get_map(max_tokens=full_token_count) == full_map
+
+    ranked_tags = strategy.get_ranked_tags()
+    for max_tokens in (0, 10, 25, full_token_count - 1):
+        budget_map = strategy.get_map(max_tokens=max_tokens)
+        assert get_token_count_from_text(strategy.model_name, budget_map) <= max_tokens
+
+        # The result is the map of a prefix of the ranked tags, that cannot be extended
+        prefix_maps = [
+            strategy.tag_list_to_tree(ranked_tags[:num_tags])
+            for num_tags in range(len(ranked_tags) + 1)
+        ]
+        num_tags = prefix_maps.index(budget_map)
+        assert num_tags < len(ranked_tags)
+        assert (
+            get_token_count_from_text(strategy.model_name, prefix_maps[num_tags + 1])
+            > max_tokens
+        )
+
+
+def test_repo_map_strategy_get_map_with_mentions(setup_git_repo_with_many_refs):
+    repo_path = setup_git_repo_with_many_refs
+    strategy = RepoMapStrategy(root=str(repo_path))
+
+    mentioned_map = strategy.get_map(mentioned_idents={'Order'})
+    assert mentioned_map == strategy.tag_list_to_tree(
+        strategy.get_ranked_tags(mentioned_idents={'Order'})
+    )
+    assert 'Token count:' in strategy.get_map_with_token_count(
+        max_tokens=20, mentioned_rel_files={'cli.py'}
+    )
+
+
+def test_repo_map_strategy_iter_map(setup_git_repo_with_many_refs, capsys):
+    repo_path = setup_git_repo_with_many_refs
+    strategy = RepoMapStrategy(root=str(repo_path))
+
+    chunks = list(strategy.iter_map(mentioned_idents={'Order'}))
+    assert '\n'.join(chunks) == strategy.get_map(mentioned_idents={'Order'})
+    assert chunks[0].startswith('models.py:\n')
+
+    strategy.stream_map(max_tokens=25)
+    assert capsys.readouterr().out == strategy.get_map(max_tokens=25) + '\n'
+
+
+def test_repo_map_strategy_async_api(setup_git_repo_with_many_refs):
+    repo_path = setup_git_repo_with_many_refs
+    strategy = RepoMapStrategy(root=str(repo_path))
+
+    async def get_maps():
+        return await asyncio.gather(
+            strategy.aget_map(mentioned_idents={'Order'}),
+            strategy.aget_map(max_tokens=25),
+            strategy.aget_ranked_tags(),
+        )
+
+    mentioned_map, budget_map, ranked_tags = asyncio.run(get_maps())
+    strategy.close()
+
+    assert mentioned_map == strategy.get_map(mentioned_idents={'Order'})
+    assert budget_map == strategy.get_map(max_tokens=25)
+    assert ranked_tags == strategy.get_ranked_tags()
+
+
+def test_repo_map_strategy_async_requests_share_parses(
+    setup_git_repo_with_many_refs, monkeypatch
+):
+    repo_path = setup_git_repo_with_many_refs
+    strategy = RepoMapStrategy(root=str(repo_path), async_workers=8)
+    resume_parse = threading.Event()
+    parsed_files = []
+    original_parse_file = strategy._parse_file_in_thread
+
+    def blocking_parse_file(abs_file, rel_file, blob_sha):
+        parsed_files.append(rel_file)
+        resume_parse.wait()
+        return original_parse_file(abs_file, rel_file, blob_sha)
+
+    monkeypatch.setattr(strategy, '_parse_file_in_thread', blocking_parse_file)
+
+    async def get_maps():
+        tasks = [asyncio.create_task(strategy.aget_map()) for _ in range(4)]
+        # Hold the parses until every request waits on each of the 4 files
+        while sum(strategy._inflight_waiters.values()) < 4 * 4:
+            await asyncio.sleep(0.01)
+        resume_parse.set()
+        return await asyncio.gather(*tasks)
+
+    maps = asyncio.run(get_maps())
+    strategy.close()
+
+    assert len(set(maps)) == 1
+    assert sorted(parsed_files) == ['api.py', 'cli.py', 'models.py', 'service.py']
+    assert not strategy._inflight_parses
+
+
+def test_repo_map_strategy_async_cancellation(
+    setup_git_repo_with_many_refs, monkeypatch
+):
+    repo_path = setup_git_repo_with_many_refs
+    strategy = RepoMapStrategy(root=str(repo_path), async_workers=1)
+    parse_started = threading.Event()
+    resume_parse = threading.Event()
+    parsed_files = []
+    original_parse_file = strategy._parse_file_in_thread
+
+    def blocking_parse_file(abs_file, rel_file, blob_sha):
+        parsed_files.append(rel_file)
+        parse_started.set()
+        resume_parse.wait()
+        return original_parse_file(abs_file, rel_file, blob_sha)
+
+    monkeypatch.setattr(strategy, '_parse_file_in_thread', blocking_parse_file)
+
+    async def cancel_map():
+        task = asyncio.create_task(strategy.aget_map())
+        await asyncio.to_thread(parse_started.wait)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        resume_parse.set()
+
+    asyncio.run(cancel_map())
+    strategy.close()
+
+    # The parses queued behind the first one never ran
+    assert len(parsed_files) == 1
+    assert not strategy._inflight_parses
+    assert not strategy._inflight_waiters
+
+
+def test_repo_map_strategy_async_skips_cancelled_inflight_parses(
+    setup_git_repo_with_many_refs,
+):
+    repo_path = setup_git_repo_with_many_refs
+    strategy = RepoMapStrategy(root=str(repo_path))
+
+    async def get_map_after_cancelled_parse():
+        # As left behind by a cancelled request, before its done callback has run
+        cancelled_future = asyncio.get_running_loop().create_future()
+        cancelled_future.cancel()
+        abs_file, _, blob_sha, file_stat = strategy._get_file_entries_to_parse(
+            None, None
+        )[0]
+        strategy._inflight_parses[(abs_file, blob_sha, file_stat)] = cancelled_future
+        return await strategy.aget_map()
+
+    async_map = asyncio.run(get_map_after_cancelled_parse())
+    strategy.close()
+
+    assert async_map == strategy.get_map()
+
+
+@pytest.fixture
+def setup_git_repo_with_ring_of_files(tmp_path):
+    repo_path = tmp_path / 'repo'
+    repo_path.mkdir()
+    run_git_command(repo_path, ['git', 'init'])
+
+    # Each module calls both of its neighbours, so that the ranks of modules placed
+    # symmetrically around a mentioned module tie exactly
+    num_modules = 30
+    for i in range(num_modules):
+        (repo_path / f'module_{i}.py').write_text(
+            f'def func_{i}():\n    pass\n\n'
+            f'def caller_{i}():\n'
+            f'    func_{(i - 1) % num_modules}()\n'
+            f'    func_{(i + 1) % num_modules}()\n'
+        )
+
+    run_git_command(repo_path, ['git', 'add', '.'])
+    run_git_command(repo_path, ['git', 'commit', '-m', 'Initial commit'])
+    return repo_path
+
+
+def test_repo_map_strategy_ranking_does_not_depend_on_previous_calls(
+    setup_git_repo_with_ring_of_files,
+):
+    repo_path = setup_git_repo_with_ring_of_files
+    strategy = RepoMapStrategy(root=str(repo_path), incremental=True)
+
+    def cold_ranked_tags(**kwargs):
+        return RepoMapStrategy(root=str(repo_path)).get_ranked_tags(**kwargs)
+
+    # Starting from the scores of another query would break the ties unevenly
+    strategy.get_ranked_tags(mentioned_rel_files={'module_3.py'})
+    assert strategy.get_ranked_tags(
+        mentioned_rel_files={'module_0.py'}
+    ) == cold_ranked_tags(mentioned_rel_files={'module_0.py'})
+
+    # Same query on a changed graph: warm-started, with the same result
+    (repo_path / 'module_15.py').write_text(
+        'def func_15():\n    pass\n\ndef caller_15():\n    func_14()\n'
+        '    func_16()\n    func_14()\n    func_16()\n'
+    )
+    assert strategy.get_ranked_tags(
+        mentioned_rel_files={'module_0.py'}
+    ) == cold_ranked_tags(mentioned_rel_files={'module_0.py'})
+    assert strategy.last_pagerank_iterations > 0
@@ -0,0 +1,79 @@
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+from locify.indexing.repo_map.strategy import RepoMapStrategy
+from locify.server import MapClient, MapServer
+
+
+def run_git_command(repo_path: Path, command: list[str]):
+    subprocess.run(command, cwd=repo_path, check=True)
+
+
+@pytest.fixture
+def setup_git_repo(tmp_path):
+    repo_path = tmp_path / 'repo'
+    repo_path.mkdir()
+    run_git_command(repo_path, ['git', 'init'])
+
+    (repo_path / 'models.py').write_text('class User:\n    pass\n')
+    (repo_path / 'service.py').write_text(
+        'from models import User\n\ndef create_user():\n    return User()\n'
+    )
+
+    run_git_command(repo_path, ['git', 'add', '.'])
+    run_git_command(repo_path, ['git', 'commit', '-m', 'Initial commit'])
+    return repo_path
+
+
+@pytest.fixture
+def map_server(setup_git_repo, tmp_path):
+    strategy = RepoMapStrategy(root=str(setup_git_repo), incremental=True)
+    server = MapServer(
+        strategy, socket_path=str(tmp_path / 'locify.sock'), poll_interval=0.05
+    )
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_server_answers_queries(map_server, setup_git_repo):
+    client = MapClient(socket_path=map_server.socket_path)
+    expected_strategy = RepoMapStrategy(root=str(setup_git_repo))
+
+    assert client.get_map() == expected_strategy.get_map()
+    assert client.get_map(
+        mentioned_idents={'create_user'}, max_tokens=100
+    ) == expected_strategy.get_map(mentioned_idents={'create_user'}, max_tokens=100)
+    assert [tag['node_name'] for tag in client.get_ranked_tags()] == [
+        tag.node_name for tag in expected_strategy.get_ranked_tags()
+    ]
+
+    with pytest.raises(RuntimeError, match='Unknown method'):
+        client.call('close')
+    with pytest.raises(RuntimeError, match='TypeError'):
+        client.get_map(unknown_param=1)
+
+
+def test_server_refreshes_changed_files(map_server, setup_git_repo):
+    client = MapClient(socket_path=map_server.socket_path)
+    assert not map_server.refresh_if_changed()
+
+    (setup_git_repo / 'models.py').write_text(
+        'class User:\n    pass\n\nclass Admin(User):\n    pass\n'
+    )
+
+    # The watcher refreshes the index in the background
+    deadline = time.monotonic() + 10
+    while map_server.get_worktree_state() != map_server._worktree_state:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert not map_server.refresh_if_changed()
+    assert 'class Admin(User):' in client.get_map()
+
+
+def test_server_requires_incremental_strategy(setup_git_repo):
+    with pytest.raises(ValueError):
+        MapServer(RepoMapStrategy(root=str(setup_git_repo)))
@@ -231,3 +231,83 @@ def test_read_text_with_image_file(tmp_path):
 
     result = read_text(str(image_file))
     assert result == ''
+
+
+def test_get_all_tracked_blob_shas(git_utils, temp_git_repo):
+    """Test that blob SHAs follow the worktree content of tracked files."""
+    blob_shas = git_utils.get_all_tracked_blob_shas()
+    file1 = str(temp_git_repo / 'file1.txt')
+    assert set(blob_shas) == set(git_utils.get_all_absolute_tracked_files())
+    assert blob_shas[file1] == git_utils.repo.git.hash_object(file1)
+
+    # Unstaged modifications are reflected in the SHA
+    (temp_git_repo / 'file1.txt').write_text('modified content')
+    assert git_utils.get_all_tracked_blob_shas()[
+        file1
+    ] == git_utils.repo.git.hash_object(file1)
+
+
+def test_get_all_abs_modified_files(git_utils, temp_git_repo):
+    """Test that both staged and unstaged modifications are reported."""
+    (temp_git_repo / 'file1.txt').write_text('modified content')
+
+    modified_files = git_utils.get_all_absolute_modified_files()
+    assert modified_files == {
+        str(temp_git_repo / 'file1.txt'),
+        str(temp_git_repo / 'staged.txt'),
+    }
+
+
+def test_get_abs_files_changed_between(git_utils, temp_git_repo):
+    """Test listing the files changed between two commits."""
+    old_commit_sha = git_utils.get_head_commit_sha()
+    (temp_git_repo / 'test_dir' / 'file3.txt').write_text('changed')
+    git_utils.repo.index.add(['test_dir/file3.txt'])
+    new_commit_sha = git_utils.repo.index.commit('Second commit').hexsha
+
+    assert git_utils.get_head_commit_sha() == new_commit_sha
+    assert git_utils.get_absolute_files_changed_between(
+        old_commit_sha, new_commit_sha
+    ) == {
+        str(temp_git_repo / 'test_dir' / 'file3.txt'),
+        str(temp_git_repo / 'staged.txt'),
+    }
+
+
+def test_tracked_file_index_is_cached_until_head_changes(git_utils, temp_git_repo):
+    """Test that the tracked file index is only rebuilt for a new commit."""
+    tracked_file_index = git_utils.get_tracked_file_index()
+    assert git_utils.get_tracked_file_index() is tracked_file_index
+
+    git_utils.repo.index.commit('Commit staged file')
+    assert git_utils.get_tracked_file_index() is not tracked_file_index
+    assert str(temp_git_repo / 'staged.txt') in (
+        git_utils.get_all_absolute_tracked_files()
+    )
+
+
+@pytest.mark.parametrize('file_listing_backend', ['index', 'ls-files'])
+def test_file_listing_backends(temp_git_repo, file_listing_backend):
+    """Test that index-based backends list the files of the index."""
+    git_utils = GitRepoUtils(
+        str(temp_git_repo), file_listing_backend=file_listing_backend
+    )
+    traverse_git_utils = GitRepoUtils(str(temp_git_repo))
+
+    # The staged file is in the index but not in HEAD
+    assert set(git_utils.get_all_absolute_tracked_files()) == set(
+        traverse_git_utils.get_all_absolute_tracked_files()
+    ) | {str(temp_git_repo / 'staged.txt')}
+    assert git_utils.get_absolute_tracked_files_in_directory(
+        'test_dir'
+    ) == traverse_git_utils.get_absolute_tracked_files_in_directory('test_dir')
+    file3 = str(temp_git_repo / 'test_dir' / 'file3.txt')
+    assert (
+        git_utils.get_all_tracked_blob_shas()[file3]
+        == traverse_git_utils.get_all_tracked_blob_shas()[file3]
+    )
+
+
+def test_invalid_file_listing_backend(temp_git_repo):
+    with pytest.raises(ValueError):
+        GitRepoUtils(str(temp_git_repo), file_listing_backend='unknown')
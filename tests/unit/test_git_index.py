@@ -0,0 +1,63 @@
+import subprocess
+
+import pytest
+
+from locify.utils.git_index import parse_ls_files_stage_output, read_git_index
+
+
+def run_git_command(repo_path, *args):
+    return subprocess.run(
+        ['git', *args], cwd=repo_path, check=True, capture_output=True, text=True
+    ).stdout
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    run_git_command(tmp_path, 'init')
+    (tmp_path / 'src' / 'pkg').mkdir(parents=True)
+    for rel_path in ['top.py', 'src/a.py', 'src/pkg/b.py', 'src/pkg/c.py']:
+        (tmp_path / rel_path).write_text(f'# {rel_path}\n')
+    run_git_command(tmp_path, 'add', '.')
+    return tmp_path
+
+
+def ls_files(repo_path):
+    return parse_ls_files_stage_output(
+        run_git_command(repo_path, 'ls-files', '-z', '--stage')
+    )
+
+
+@pytest.mark.parametrize('index_version', ['2', '3', '4'])
+def test_read_git_index_matches_ls_files(git_repo, index_version):
+    # Intent-to-add entries use the extended flags of version 3 and later
+    (git_repo / 'new.py').write_text('new\n')
+    run_git_command(git_repo, 'add', '-N', 'new.py')
+    run_git_command(git_repo, 'update-index', '--index-version', index_version)
+
+    files = read_git_index(git_repo / '.git' / 'index')
+    assert files == ls_files(git_repo)
+    assert [rel_path for rel_path, _ in files] == [
+        'new.py',
+        'src/a.py',
+        'src/pkg/b.py',
+        'src/pkg/c.py',
+        'top.py',
+    ]
+
+
+def test_read_git_index_skips_submodules(git_repo):
+    run_git_command(git_repo, 'commit', '-m', 'Initial commit')
+    head_sha = run_git_command(git_repo, 'rev-parse', 'HEAD').strip()
+    run_git_command(
+        git_repo, 'update-index', '--add', '--cacheinfo', f'160000,{head_sha},sub'
+    )
+
+    files = read_git_index(git_repo / '.git' / 'index')
+    assert 'sub' not in {rel_path for rel_path, _ in files}
+    assert files == ls_files(git_repo)
+
+
+def test_read_git_index_rejects_invalid_files(tmp_path):
+    (tmp_path / 'index').write_bytes(b'not an index')
+    with pytest.raises(ValueError):
+        read_git_index(tmp_path / 'index')
@@ -0,0 +1,42 @@
+import pytest
+
+from locify.utils.lru import ByteBoundedLRUCache
+
+
+def test_get_and_put():
+    cache = ByteBoundedLRUCache(max_bytes=10)
+    assert cache.get('a') is None
+
+    cache.put('a', 'aaa', 3)
+    assert cache.get('a') == 'aaa'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = ByteBoundedLRUCache(max_bytes=10)
+    cache.put('a', 'a', 4)
+    cache.put('b', 'b', 4)
+    cache.get('a')
+    cache.put('c', 'c', 4)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'a'
+    assert cache.get('c') == 'c'
+    assert cache.num_bytes == 8
+
+
+def test_replacing_and_oversized_values():
+    cache = ByteBoundedLRUCache(max_bytes=10)
+    cache.put('a', 'a', 4)
+    cache.put('a', 'aa', 6)
+    assert cache.num_bytes == 6
+
+    cache.put('a', 'too big', 11)
+    assert cache.get('a') is None
+    assert cache.num_bytes == 0
+    assert len(cache) == 0
+
+
+def test_invalid_max_bytes():
+    with pytest.raises(ValueError):
+        ByteBoundedLRUCache(max_bytes=-1)
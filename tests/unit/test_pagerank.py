@@ -0,0 +1,89 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from locify.indexing.repo_map.pagerank import build_transition_matrix, pagerank
+
+
+def random_multigraph(num_nodes: int, num_edges: int, seed: int):
+    rng = np.random.default_rng(seed)
+    src_ids = rng.integers(0, num_nodes, num_edges)
+    dst_ids = rng.integers(0, num_nodes, num_edges)
+    weights = rng.integers(1, 5, num_edges).astype(np.float64)
+    G = nx.MultiDiGraph()
+    G.add_nodes_from(range(num_nodes))
+    for src_id, dst_id, weight in zip(src_ids, dst_ids, weights):
+        G.add_edge(int(src_id), int(dst_id), weight=float(weight))
+    return src_ids, dst_ids, weights, G
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_pagerank_matches_networkx(seed):
+    src_ids, dst_ids, weights, G = random_multigraph(50, 120, seed)
+    transition_t, out_weights = build_transition_matrix(50, src_ids, dst_ids, weights)
+
+    ranks, _ = pagerank(transition_t, out_weights)
+
+    expected = nx.pagerank(G)
+    np.testing.assert_allclose(ranks, [expected[i] for i in range(50)], atol=1e-9)
+
+
+def test_personalized_pagerank_matches_networkx():
+    src_ids, dst_ids, weights, G = random_multigraph(30, 40, seed=3)
+    transition_t, out_weights = build_transition_matrix(30, src_ids, dst_ids, weights)
+    personalization = np.zeros(30)
+    personalization[[2, 7]] = 1.0
+
+    ranks, _ = pagerank(
+        transition_t,
+        out_weights,
+        personalization=personalization,
+        dangling=personalization,
+    )
+
+    personalization_dict = {2: 1.0, 7: 1.0}
+    expected = nx.pagerank(
+        G, personalization=personalization_dict, dangling=personalization_dict
+    )
+    np.testing.assert_allclose(ranks, [expected[i] for i in range(30)], atol=1e-9)
+
+
+def test_build_transition_matrix_sums_parallel_edges():
+    transition_t, out_weights = build_transition_matrix(
+        3, np.array([0, 0, 1]), np.array([1, 1, 2]), np.array([1.0, 3.0, 2.0])
+    )
+
+    np.testing.assert_array_equal(out_weights, [4.0, 2.0, 0.0])
+    np.testing.assert_allclose(
+        transition_t.toarray(), [[0, 0, 0], [1.0, 0, 0], [0, 1.0, 0]]
+    )
+
+
+def test_pagerank_on_empty_graph():
+    transition_t, out_weights = build_transition_matrix(
+        0, np.array([], dtype=int), np.array([], dtype=int), np.array([])
+    )
+    assert len(pagerank(transition_t, out_weights).scores) == 0
+
+
+def test_pagerank_warm_start_converges_faster():
+    src_ids, dst_ids, weights, _ = random_multigraph(2000, 8000, seed=4)
+    transition_t, out_weights = build_transition_matrix(2000, src_ids, dst_ids, weights)
+    previous_personalization = np.zeros(2000)
+    previous_personalization[[5, 6, 7]] = 1.0
+    personalization = np.zeros(2000)
+    personalization[[5, 6, 8]] = 1.0
+
+    previous = pagerank(
+        transition_t, out_weights, personalization=previous_personalization
+    )
+    cold = pagerank(transition_t, out_weights, personalization=personalization)
+    warm = pagerank(
+        transition_t,
+        out_weights,
+        personalization=personalization,
+        nstart=previous.scores,
+    )
+
+    assert warm.iterations < cold.iterations
+    np.testing.assert_allclose(warm.scores, cold.scores, atol=1e-5)
@@ -0,0 +1,39 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from locify.tree_sitter.parallel import (
+    init_parser_worker,
+    parse_files_chunk,
+    parse_files_in_parallel,
+)
+from locify.tree_sitter.parser import TreeSitterParser, to_compact_tag
+
+
+def test_parse_files_chunk(tmp_path):
+    python_file = tmp_path / 'test.py'
+    python_file.write_text('def foo():\n    foo()\n')
+    unsupported_file = tmp_path / 'test.xyz'
+    unsupported_file.write_text('Some content')
+
+    results = parse_files_chunk(
+        [(str(python_file), 'test.py'), (str(unsupported_file), 'test.xyz')]
+    )
+
+    assert results == [[(0, 'foo', 'def'), (1, 'foo', 'ref')], None]
+
+
+def test_parse_files_in_parallel_keeps_input_order(tmp_path):
+    files = []
+    for i in range(20):
+        python_file = tmp_path / f'test{i}.py'
+        python_file.write_text(f'def func{i}():\n    pass\n')
+        files.append((str(python_file), python_file.name))
+
+    with ProcessPoolExecutor(max_workers=2, initializer=init_parser_worker) as pool:
+        results = list(parse_files_in_parallel(pool, files, workers=2))
+
+    parser = TreeSitterParser()
+    expected = [
+        [to_compact_tag(tag) for tag in parser.get_tags_from_file(abs_path, rel_path)]
+        for abs_path, rel_path in files
+    ]
+    assert results == expected
@@ -0,0 +1,32 @@
+from locify.indexing.repo_map.graph import ReferenceGraph
+
+
+def test_set_ident_edges_and_edge_arrays():
+    graph = ReferenceGraph()
+    graph.set_ident_edges('foo', [('b.py', 'a.py', 2), ('c.py', 'a.py', 1)])
+    graph.set_ident_edges('bar', [('a.py', 'c.py', 3)])
+
+    src_ids, dst_ids, ident_ids, weights = graph.get_edge_arrays()
+    edges = {
+        (graph.rel_files[src], graph.rel_files[dst], graph.idents[ident], weight)
+        for src, dst, ident, weight in zip(
+            src_ids.tolist(), dst_ids.tolist(), ident_ids.tolist(), weights.tolist()
+        )
+    }
+    assert edges == {
+        ('b.py', 'a.py', 'foo', 2),
+        ('c.py', 'a.py', 'foo', 1),
+        ('a.py', 'c.py', 'bar', 3),
+    }
+
+
+def test_replacing_ident_edges():
+    graph = ReferenceGraph()
+    graph.set_ident_edges('foo', [('b.py', 'a.py', 2)])
+    graph.get_edge_arrays()
+
+    graph.set_ident_edges('foo', [])
+    src_ids, _, _, _ = graph.get_edge_arrays()
+    assert len(src_ids) == 0
+    # Interned ids are stable across updates
+    assert graph.rel_file_ids == {'b.py': 0, 'a.py': 1}
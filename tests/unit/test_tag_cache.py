@@ -0,0 +1,75 @@
+import pytest
+
+from locify.tree_sitter import cache as cache_module
+from locify.tree_sitter.cache import TagCache, get_cache_version
+from locify.tree_sitter.parser import TagKind, TreeSitterParser
+
+
+@pytest.fixture
+def tag_cache(tmp_path):
+    tag_cache = TagCache(str(tmp_path / '.locify' / 'tags.db'))
+    yield tag_cache
+    tag_cache.close()
+
+
+def test_get_missing_entry(tag_cache):
+    assert tag_cache.get('python', 'deadbeef') is None
+
+
+def test_put_and_get_before_and_after_flush(tag_cache):
+    tags = [(0, 'foo', 'def'), (3, 'bar', 'ref')]
+    tag_cache.put('python', 'deadbeef', tags)
+    assert tag_cache.get('python', 'deadbeef') == tags
+
+    tag_cache.flush()
+    assert tag_cache.get('python', 'deadbeef') == tags
+    # The language is part of the key
+    assert tag_cache.get('javascript', 'deadbeef') is None
+
+
+def test_entries_persist_across_instances(tmp_path):
+    db_path = str(tmp_path / 'tags.db')
+    tag_cache = TagCache(db_path)
+    tag_cache.put('python', 'deadbeef', [(1, 'foo', 'def')])
+    tag_cache.close()
+
+    reopened = TagCache(db_path)
+    assert reopened.get('python', 'deadbeef') == [(1, 'foo', 'def')]
+    reopened.close()
+
+
+def test_version_change_invalidates_entries(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'tags.db')
+    tag_cache = TagCache(db_path)
+    tag_cache.put('python', 'deadbeef', [(1, 'foo', 'def')])
+    tag_cache.close()
+
+    monkeypatch.setattr(cache_module, 'CACHE_FORMAT_VERSION', -1)
+    reopened = TagCache(db_path)
+    assert reopened.get('python', 'deadbeef') is None
+    reopened.close()
+
+
+def test_cache_version_depends_on_query_files(tmp_path, monkeypatch):
+    queries_dir = tmp_path / 'queries'
+    queries_dir.mkdir()
+    (queries_dir / 'tree-sitter-python-tags.scm').write_text('(identifier) @name')
+    monkeypatch.setattr(cache_module, 'QUERIES_DIR', queries_dir)
+    version_before = get_cache_version()
+
+    (queries_dir / 'tree-sitter-python-tags.scm').write_text('(call) @name')
+    assert get_cache_version() != version_before
+
+
+def test_parser_uses_cache(tag_cache, tmp_path):
+    python_file = tmp_path / 'test.py'
+    python_file.write_text('def foo():\n    pass\n')
+    parser = TreeSitterParser(tag_cache=tag_cache)
+
+    tags = parser.get_tags_from_file(str(python_file), 'test.py', blob_sha='abc')
+    assert [(tag.node_name, tag.tag_kind) for tag in tags] == [('foo', TagKind.DEF)]
+
+    # Cached tags are served without reading the file again
+    python_file.unlink()
+    cached_tags = parser.get_tags_from_file(str(python_file), 'test.py', blob_sha='abc')
+    assert cached_tags == tags
@@ -0,0 +1,47 @@
+from locify.indexing.repo_map.tag_index import TagIndex
+from locify.tree_sitter.parser import ParsedTag, TagKind
+
+
+def make_tag(rel_path: str, start_line: int, node_name: str, tag_kind: TagKind):
+    return ParsedTag(
+        rel_path=rel_path,
+        abs_path=f'/repo/{rel_path}',
+        start_line=start_line,
+        node_name=node_name,
+        tag_kind=tag_kind,
+    )
+
+
+def test_set_file_tags_builds_maps():
+    tag_index = TagIndex()
+    def_tag = make_tag('a.py', 0, 'foo', TagKind.DEF)
+    tag_index.set_file_tags('a.py', [def_tag])
+    affected_idents = tag_index.set_file_tags(
+        'b.py', [make_tag('b.py', i, 'foo', TagKind.REF) for i in range(4)]
+    )
+
+    assert affected_idents == {'foo'}
+    assert tag_index.ident2defrels == {'foo': {'a.py'}}
+    assert tag_index.ident2refrels == {'foo': {'b.py': 4}}
+    assert tag_index.identwrel2tags == {('a.py', 'foo'): {def_tag}}
+    assert tag_index.get_all_idents() == {'foo'}
+    # The number of references is scaled down by its square root
+    assert tag_index.get_edges('foo') == [('b.py', 'a.py', 2)]
+
+
+def test_replacing_and_removing_files():
+    tag_index = TagIndex()
+    tag_index.set_file_tags('a.py', [make_tag('a.py', 0, 'foo', TagKind.DEF)])
+    tag_index.set_file_tags('b.py', [make_tag('b.py', 0, 'foo', TagKind.REF)])
+
+    affected_idents = tag_index.set_file_tags(
+        'a.py', [make_tag('a.py', 0, 'bar', TagKind.DEF)]
+    )
+    assert affected_idents == {'foo', 'bar'}
+    assert tag_index.get_edges('foo') == []
+    assert ('a.py', 'foo') not in tag_index.identwrel2tags
+
+    assert tag_index.remove_file('b.py') == {'foo'}
+    assert tag_index.remove_file('missing.py') == set()
+    assert dict(tag_index.ident2refrels) == {}
+    assert tag_index.file_tags.keys() == {'a.py'}
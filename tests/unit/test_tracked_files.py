@@ -0,0 +1,40 @@
+from locify.utils.tracked_files import TrackedFileIndex
+
+
+def make_index():
+    rel_paths = ['b.py', 'src/a.py', 'src/pkg/c.py', 'src/pkg/deep/d.py', 'srcx/e.py']
+    return TrackedFileIndex(rel_paths, [f'sha{i}' for i in range(len(rel_paths))])
+
+
+def test_get_rel_paths():
+    index = make_index()
+    assert index.get_rel_paths() == index.rel_paths
+    assert index.get_rel_paths(depth=2) == ['b.py', 'src/a.py', 'srcx/e.py']
+
+
+def test_get_rel_paths_in_directory():
+    index = make_index()
+    assert index.get_rel_paths('src') == [
+        'src/a.py',
+        'src/pkg/c.py',
+        'src/pkg/deep/d.py',
+    ]
+    assert index.get_rel_paths('src/pkg/', depth=3) == ['src/pkg/c.py']
+    assert index.get_rel_paths('src/pkg', depth=2) == []
+    # Neither prefixes of names nor files are directories
+    assert index.get_rel_paths('sr') == []
+    assert index.get_rel_paths('b.py') == []
+
+
+def test_get_rel_paths_keeps_original_order():
+    index = TrackedFileIndex(['z/b.py', 'a.py', 'z/a.py'], ['1', '2', '3'])
+    assert index.get_rel_paths('z') == ['z/b.py', 'z/a.py']
+
+
+def test_render_tree():
+    index = make_index()
+    assert index.render_tree('src/pkg', depth=3) == (
+        '└── src\n    └── pkg\n        ├── c.py\n        └── deep\n'
+    )
+    assert index.render_tree('nonexistent') == ''
+    assert TrackedFileIndex([], []).render_tree() == ''
@@ -92,3 +92,21 @@ def test_get_tags_from_empty_file(parser, tmp_path):
         str(empty_file.absolute()), str(empty_file.relative_to(tmp_path))
     )
     assert tags == []
+
+
+def test_language_registry_reuses_compiled_objects(parser, tmp_path):
+    for i in range(3):
+        python_file = tmp_path / f'test{i}.py'
+        python_file.write_text(f'def func{i}():\n    pass\n')
+        parser.get_tags_from_file(str(python_file), python_file.name)
+
+    # The language is loaded lazily on first use, then served from the registry
+    assert parser.get_registry_stats() == {'hits': 2, 'misses': 1, 'languages': 1}
+    assert parser.get_language_entry('python') is parser.get_language_entry('python')
+
+
+def test_language_registry_without_tags_query(parser):
+    # A language known to tree-sitter but without a tags query file
+    assert parser.get_language_entry('markdown') is None
+    assert parser.get_language_entry('markdown') is None
+    assert parser.get_registry_stats() == {'hits': 1, 'misses': 1, 'languages': 0}